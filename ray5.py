@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""Headless command line for the Longer Ray5, sharing config.json with the GUI.
+
+    ray5 ls [PATH]               list SD card files as JSON
+    ray5 put FILE|GLOB...        upload files
+    ray5 engrave IMAGE           render an image to raster G-code while uploading it
+    ray5 rm NAME|GLOB...         delete files (globs match the SD listing)
+    ray5 cmd COMMAND             send a raw ESP3D command, e.g. [ESP420]
+    ray5 discover                find the known laser on the network by MAC
+    ray5 watch                   print connection and SD listing changes as JSON lines
+    ray5 sync FOLDER             upload finished G-code from a CAM output folder as it appears
+    ray5 fleet ACTION ...        run ls/cmd/put/rm on many lasers at once (asyncio)
+
+Deliberately free of tkinter/tkinterdnd2 imports so it starts fast on headless machines.
+"""
+import argparse
+import fnmatch
+import glob
+import json
+import logging
+import os
+import sys
+import time
+
+import ray5_client
+from ray5_gcode import GCODE_PATTERNS
+
+log = logging.getLogger("ray5.cli")
+
+
+def emit(args, obj):
+    print(json.dumps(obj, indent=args.indent))
+    sys.stdout.flush()
+
+
+def result_fields(res, text_key="detail"):
+    return {text_key: str(res), "ok": res.ok, "http_code": res.http_code, "category": res.category,
+            "elapsed": round(res.elapsed, 4), "bytes": res.bytes}
+
+
+def resolve_ip(args, config):
+    ip = args.ip or config.get("last_ip")
+    if not ip:
+        sys.exit("ray5: no laser IP given and none saved in config; use --ip or 'ray5 discover --save'")
+    return ip
+
+
+def make_client(args, config):
+    client = ray5_client.client_from_config(config, resolve_ip(args, config), args.port)
+    if getattr(args, "minify", False):
+        from ray5_gcode import GcodeMinifier
+        client.transform = GcodeMinifier(args.precision)
+    return client
+
+
+def minify_fields(client, path):
+    transform = client.upload_transform(path)
+    if transform is None:
+        return {}
+    report = transform.measure(path)
+    return {"minify": {"bytes_in": report.bytes_in, "bytes_out": report.bytes_out,
+                       "saved_percent": round(report.percent, 1)}}
+
+
+def validate_paths(args, config, paths):
+    """(clean, {path: report}) by the pre-upload G-code check; all clean with --force."""
+    gcode = [p for p in paths if any(fnmatch.fnmatch(p.lower(), pat) for pat in GCODE_PATTERNS)]
+    if getattr(args, "force", False) or not gcode:
+        return paths, {}
+    # numpy is only loaded when there is G-code to check
+    from ray5_validate import validate_file, validation_from_config
+    validation = validation_from_config(config)
+    if validation is None:
+        return paths, {}
+    machine, rules = validation
+    flagged = {}
+    for path in gcode:
+        try:
+            report = validate_file(path, machine, rules)
+        except OSError:
+            # Left to the upload, which reports it like any other failure
+            continue
+        if not report.ok:
+            flagged[path] = report
+    return [p for p in paths if p not in flagged], flagged
+
+
+def report_fields(report):
+    return {"problems": report.counts,
+            "violations": [{"line": v.line, "rule": v.rule, "message": v.message} for v in report.violations]}
+
+
+def device_key(config, client):
+    # Same manifest key the GUI uses: the laser's MAC when we know it belongs to this IP
+    if config.get("last_ip") == client.ip and config.get("last_mac") not in (None, "Unknown"):
+        return config["last_mac"]
+    return client.ip
+
+
+def expand_local(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            log.warning(f"No files match {pattern}")
+        paths.extend(p for p in matches if os.path.isfile(p))
+    return paths
+
+
+def cmd_ls(args, config, client):
+    emit(args, client.get_files(args.path))
+    return 0
+
+
+def cmd_put(args, config, client):
+    paths = expand_local(args.files)
+    skipped = []
+    manifest = None
+    if args.skip_unchanged:
+        manifest = ray5_client.UploadManifest(ray5_client.config_file("upload_manifest.json", args.config))
+        paths, skipped = manifest.plan(device_key(config, client), paths, client.list_files(args.path),
+                                       args.path)
+
+    def on_progress(progress):
+        if args.progress:
+            sys.stderr.write(f"\r{progress.name}: {progress.fraction:.0%} "
+                             f"{progress.rate / 1e6:.2f} MB/s ETA {ray5_client.format_duration(progress.eta)}   ")
+            if progress.sent >= progress.total:
+                sys.stderr.write("\n")
+
+    paths, flagged = validate_paths(args, config, paths)
+    results = [{"file": p, "status": "skipped"} for p in skipped]
+    results += [{"file": p, "status": "rejected", **report_fields(r)} for p, r in flagged.items()]
+    failed = len(flagged)
+    for path in paths:
+        res = client.upload_file(path, args.path, progress=on_progress)
+        if res.ok and manifest is not None:
+            manifest.record(device_key(config, client), path, args.path, client.upload_size(path))
+        failed += not res.ok
+        results.append({"file": path, "status": "uploaded" if res.ok else "failed", **result_fields(res),
+                        **minify_fields(client, path)})
+    if manifest is not None:
+        manifest.save()
+    emit(args, results)
+    return 1 if failed else 0
+
+
+def cmd_engrave(args, config, client):
+    from ray5_raster import HAS_NUMPY, HAS_PIL, MODES, RasterEngraver, gcode_name, raster_settings
+    from ray5_validate import validate_chunks, validation_from_config
+
+    if args.mode is not None and args.mode not in MODES:
+        emit(args, {"file": args.image, "status": "failed", "detail": f"unknown mode {args.mode!r}"})
+        return 2
+    overrides = {key: getattr(args, key) for key in ("width", "interval", "mode", "power", "min_power", "feed")
+                 if getattr(args, key) is not None}
+    if args.origin:
+        overrides["origin"] = list(args.origin)
+    if args.one_way:
+        overrides["bidirectional"] = False
+    if args.negative:
+        overrides["negative"] = True
+    if not (HAS_PIL and HAS_NUMPY):
+        emit(args, {"file": args.image, "status": "failed", "detail": "engraving images needs Pillow and numpy"})
+        return 1
+    engraver = RasterEngraver(raster_settings(config, **overrides))
+    name = args.name or gcode_name(args.image)
+    validation = None if args.force else validation_from_config(config)
+    if validation is not None:
+        report = validate_chunks(engraver.chunks(args.image), *validation, path=name)
+        if not report.ok:
+            emit(args, {"file": args.image, "name": name, "status": "rejected", **report_fields(report)})
+            return 1
+    res = client.upload_file(args.image, args.path, transform=engraver, filename=name)
+    result = {"file": args.image, "name": name, "status": "uploaded" if res.ok else "failed", **result_fields(res)}
+    if res.ok:
+        rows, cols = engraver.power(args.image).shape
+        result.update(pixels=[cols, rows], size=engraver.output_size(args.image))
+    emit(args, result)
+    return 0 if res.ok else 1
+
+
+def cmd_rm(args, config, client):
+    names = args.names
+    if any(glob.has_magic(n) for n in names):
+        remote = [f.get("name") for f in client.get_files(args.path)]
+        names = [r for r in remote if any(fnmatch.fnmatchcase(r, n) for n in args.names)]
+    results = []
+    failed = 0
+    outcome = client.delete_files(names, args.path, window=config.get("delete_window"))
+    for name in names:
+        res = outcome[name]
+        failed += not res.ok
+        results.append({"file": name, "status": "deleted" if res.ok else "failed", **result_fields(res)})
+    emit(args, results)
+    return 1 if failed else 0
+
+
+def cmd_cmd(args, config, client):
+    res = client.send_command(args.command)
+    emit(args, {"command": args.command, **result_fields(res, "response")})
+    return 0 if res.ok else 1
+
+
+def cmd_discover(args, config):
+    # asyncio is only needed here
+    from ray5_discovery import find_laser, parse_sta_mac
+
+    mac = args.mac or config.get("last_mac")
+    if not mac or mac == "Unknown":
+        sys.exit("ray5: no MAC given and none saved in config; use --mac")
+    scan = config.get("scan", {})
+    found = find_laser(
+        mac,
+        cidr=args.cidr or scan.get("cidr"),
+        hint_ip=config.get("last_ip"),
+        port=args.port,
+        concurrency=scan.get("concurrency", 64),
+        timeout=scan.get("timeout", 1.5),
+    )
+    if not found:
+        emit(args, {"mac": mac, "ip": None})
+        return 1
+    ip, info = found
+    if args.save:
+        config.update({"last_mac": parse_sta_mac(info) or mac, "last_ip": ip})
+        ray5_client.save_config(config, args.config)
+    emit(args, {"mac": mac, "ip": ip})
+    return 0
+
+
+def cmd_watch(args, config, client):
+    known = None
+    alive = None
+    while True:
+        ok = client.send_command("[ESP400]").ok
+        if ok != alive:
+            alive = ok
+            emit(args, {"time": time.time(), "event": "up" if ok else "down", "ip": client.ip})
+        if ok:
+            files = {f.get("name"): f.get("size") for f in client.get_files(args.path)}
+            if known is not None:
+                for name, size in files.items():
+                    if name not in known:
+                        emit(args, {"time": time.time(), "event": "added", "file": name, "size": size})
+                    elif known[name] != size:
+                        emit(args, {"time": time.time(), "event": "changed", "file": name, "size": size})
+                for name in known.keys() - files.keys():
+                    emit(args, {"time": time.time(), "event": "removed", "file": name})
+            known = files
+        time.sleep(args.interval)
+
+
+def cmd_sync(args, config, client):
+    from ray5_watch import DEFAULT_PATTERNS, FolderSync, SyncEventLog
+
+    settings = config.get("watch", {})
+    remote = args.path or settings.get("remote_path", "/")
+    device = device_key(config, client)
+    manifest = ray5_client.UploadManifest(ray5_client.config_file("upload_manifest.json", args.config))
+    events = SyncEventLog(args.log)
+
+    def finish(path, event="on_sd", **fields):
+        # Jobs restored from --queue were seen by an earlier run: logged without a latency
+        emit(args, events.finished(path, event, **fields) or events.write(event, path, **fields))
+
+    def notify(event, job):
+        if event == "done":
+            manifest.record(device, job.local_path, job.remote_path, job.uploaded_size)
+            manifest.save()
+            finish(job.local_path, remote_path=job.remote_path, attempts=job.attempts)
+        elif event == "failed":
+            finish(job.local_path, "failed", category=job.category, error=job.last_error)
+
+    retry = config.get("upload_retry", {})
+    uploads = ray5_client.UploadQueue(
+        lambda: client, lambda: True, path=args.queue,
+        max_attempts=retry.get("max_attempts", 6),
+        backoff_base=retry.get("backoff_base", 2.0),
+        backoff_cap=retry.get("backoff_cap", 60.0),
+        notify=notify,
+        get_device=lambda: device,
+    )
+
+    def on_ready(batch):
+        paths = [path for path, _ in batch]
+        for path, seen in batch:
+            if not events.tracked(path):
+                emit(args, events.seen(path, seen))
+        paths, unchanged = manifest.plan(device, paths, client.list_files(remote), remote)
+        for path in unchanged:
+            finish(path, "unchanged")
+        paths, flagged = validate_paths(args, config, paths)
+        for path, report in flagged.items():
+            finish(path, "rejected", **report_fields(report))
+        for job in uploads.add(paths, remote, device):
+            emit(args, events.write("queued", job.local_path, remote_path=remote))
+
+    def on_removed(paths):
+        names = {os.path.basename(p): p for p in paths}
+        for name, res in client.delete_files(list(names), remote).items():
+            emit(args, events.write("removed", names[name], remote_path=remote, ok=res.ok, detail=str(res)))
+
+    sync = FolderSync(
+        args.folder, on_ready,
+        on_removed if (args.delete or settings.get("delete")) else None,
+        patterns=tuple(args.pattern or settings.get("patterns", DEFAULT_PATTERNS)),
+        settle=args.settle if args.settle is not None else settings.get("settle", 2.0),
+        poll_interval=settings.get("poll_interval", 1.0),
+        use_inotify=not (args.poll or settings.get("poll", False)),
+    )
+    uploads.start()
+    sync.start()
+    try:
+        while sync.is_alive():
+            time.sleep(0.5)
+    finally:
+        sync.stop()
+        uploads.stop()
+    return 1
+
+
+def fleet_hosts(args, config):
+    if args.hosts:
+        return [h.strip() for h in args.hosts.split(",") if h.strip()]
+    return [entry["ip"] for entry in config.get("fleet", []) if entry.get("ip")]
+
+
+def cmd_fleet(args, config):
+    # asyncio client is only needed here
+    import asyncio
+    from ray5_async import async_client_from_config, broadcast_upload
+
+    hosts = fleet_hosts(args, config)
+    if not hosts:
+        sys.exit("ray5: no lasers given; use --hosts or a \"fleet\" list in config")
+    paths = expand_local(args.files) if args.action == "put" else []
+
+    async def run_one(client, limit):
+        async with limit:
+            if args.action == "ls":
+                return await client.get_files(args.path)
+            if args.action == "cmd":
+                res = await client.send_command(args.command)
+                return result_fields(res, "response")
+            return [{"file": n, **result_fields(await client.delete_file(n, args.path))} for n in args.names]
+
+    async def run_all():
+        clients = [async_client_from_config(config, ip, args.port) for ip in hosts]
+        try:
+            if args.action == "put":
+                # Each file is read once and streamed to every laser at the same time
+                results = {ip: [] for ip in hosts}
+                for path in paths:
+                    for ip, res in (await broadcast_upload(clients, path, args.path)).items():
+                        results[ip].append({"file": path, **result_fields(res)})
+                return results
+            limit = asyncio.Semaphore(args.max_lasers)
+            results = await asyncio.gather(*(run_one(c, limit) for c in clients), return_exceptions=True)
+            return {ip: (repr(r) if isinstance(r, BaseException) else r) for ip, r in zip(hosts, results)}
+        finally:
+            for client in clients:
+                await client.close()
+
+    results = asyncio.run(run_all())
+    emit(args, results)
+    # An exception (repr) or any OpResult that is not ok fails the run, as in put/cmd
+    failed = [ip for ip, r in results.items() if isinstance(r, str) or any(
+        isinstance(item, dict) and item.get("ok") is False for item in (r if isinstance(r, list) else [r]))]
+    return 1 if failed else 0
+
+
+def add_minify_arguments(p):
+    p.add_argument("--minify", action="store_true",
+                   help="strip comments and redundant modal words from G-code while sending (see ray5_gcode.py)")
+    p.add_argument("--precision", type=int, help="with --minify, round coordinates to this many decimals")
+
+
+def add_force_argument(p):
+    p.add_argument("--force", action="store_true",
+                   help="upload G-code that fails the safety check (work area, max S, M5 at the end; see ray5_validate.py)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ray5", description="Longer Ray5 command line client")
+    parser.add_argument("--ip", help="laser IP (default: last_ip from config)")
+    parser.add_argument("--port", type=int, default=8848)
+    parser.add_argument("--config", default=ray5_client.CONFIG_PATH, help="config file shared with the GUI")
+    parser.add_argument("--indent", type=int, default=None, help="pretty-print JSON output")
+    parser.add_argument("-v", "--verbose", action="count", default=0)
+    sub = parser.add_subparsers(dest="command_name", required=True)
+
+    p = sub.add_parser("ls", help="list files")
+    p.add_argument("path", nargs="?", default="/")
+    p.set_defaults(func=cmd_ls)
+
+    p = sub.add_parser("put", help="upload files")
+    p.add_argument("files", nargs="+", help="files or glob patterns")
+    p.add_argument("--path", default="/", help="remote directory")
+    p.add_argument("--skip-unchanged", action="store_true", help="skip files the manifest says are already there")
+    p.add_argument("--progress", action="store_true", help="show progress on stderr")
+    add_force_argument(p)
+    add_minify_arguments(p)
+    p.set_defaults(func=cmd_put)
+
+    p = sub.add_parser("engrave", help="engrave an image (raster G-code is generated while uploading)")
+    p.add_argument("image")
+    p.add_argument("--path", default="/", help="remote directory")
+    p.add_argument("--name", help="G-code name on the SD card (default: image name with .gcode)")
+    p.add_argument("--width", type=float, help="mm")
+    p.add_argument("--interval", type=float, help="mm between lines")
+    # Not validated here: listing the modes would load numpy for every command
+    p.add_argument("--mode", help="floyd, ordered, threshold or grayscale")
+    p.add_argument("--power", type=int, help="S for black")
+    p.add_argument("--min-power", type=int, help="S for the lightest grey in grayscale mode")
+    p.add_argument("--feed", type=float, help="mm/min")
+    p.add_argument("--origin", type=float, nargs=2, metavar=("X", "Y"))
+    p.add_argument("--one-way", action="store_true", help="burn every line left to right")
+    p.add_argument("--negative", action="store_true")
+    add_force_argument(p)
+    p.set_defaults(func=cmd_engrave)
+
+    p = sub.add_parser("rm", help="delete files")
+    p.add_argument("names", nargs="+", help="remote names or glob patterns")
+    p.add_argument("--path", default="/", help="remote directory")
+    p.set_defaults(func=cmd_rm)
+
+    p = sub.add_parser("cmd", help="send an ESP3D command")
+    p.add_argument("command")
+    p.set_defaults(func=cmd_cmd)
+
+    p = sub.add_parser("discover", help="scan the network for the laser MAC")
+    p.add_argument("--mac", help="MAC to look for (default: last_mac from config)")
+    p.add_argument("--cidr", help="network to scan (default: local /24)")
+    p.add_argument("--save", action="store_true", help="store the found IP in config")
+    p.set_defaults(func=cmd_discover, needs_client=False)
+
+    p = sub.add_parser("watch", help="report connection and SD card changes")
+    p.add_argument("--path", default="/")
+    p.add_argument("--interval", type=float, default=2.0)
+    p.set_defaults(func=cmd_watch)
+
+    p = sub.add_parser("sync", help="watch a folder and upload finished files (Ctrl+C to stop)")
+    p.add_argument("folder")
+    p.add_argument("--path", help="remote directory (default: watch.remote_path from config or /)")
+    p.add_argument("--delete", action="store_true", help="delete files from the SD card when removed locally")
+    p.add_argument("--settle", type=float, help="seconds a file must stay unchanged before upload")
+    p.add_argument("--poll", action="store_true", help="poll instead of inotify (needed for network shares)")
+    p.add_argument("--pattern", action="append", help="file pattern to sync, repeatable (default: G-code)")
+    p.add_argument("--queue", default="sync_queue.json", help="pending uploads, kept across restarts")
+    p.add_argument("--log", default="sync_events.jsonl", help="event log with seen-to-SD latency")
+    add_force_argument(p)
+    add_minify_arguments(p)
+    p.set_defaults(func=cmd_sync)
+
+    p = sub.add_parser("fleet", help="run one action on many lasers concurrently")
+    p.add_argument("--hosts", help="comma separated IPs (default: \"fleet\" list from config)")
+    p.add_argument("--max-lasers", type=int, default=16, help="lasers driven at the same time")
+    p.set_defaults(func=cmd_fleet, needs_client=False)
+    actions = p.add_subparsers(dest="action", required=True)
+    a = actions.add_parser("ls")
+    a.add_argument("path", nargs="?", default="/")
+    a = actions.add_parser("cmd")
+    a.add_argument("command")
+    a = actions.add_parser("put")
+    a.add_argument("files", nargs="+")
+    a.add_argument("--path", default="/")
+    a = actions.add_parser("rm")
+    a.add_argument("names", nargs="+")
+    a.add_argument("--path", default="/")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.WARNING - 10 * min(args.verbose, 2),
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        stream=sys.stderr,
+    )
+    config = ray5_client.load_config(args.config)
+    try:
+        if not getattr(args, "needs_client", True):
+            return args.func(args, config)
+        with make_client(args, config) as client:
+            return args.func(args, config, client)
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+"""asyncio counterpart of Ray5Client for driving many lasers from one event loop.
+
+AsyncRay5Client has the same methods and OpResult return values as Ray5Client, but talks
+HTTP/1.1 over asyncio streams: connections are kept alive and reused, each laser
+gets its own cap on concurrent requests, and cancelling the calling task aborts
+the request (its connection is discarded rather than returned to the pool).
+
+AsyncLoopThread runs one such event loop in the background so threaded code
+(the GUI's TaskRunner, the CLI) can submit coroutines to it.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+from ray5_client import (DEFAULT_TIMEOUTS, UPLOAD_CHUNK_SIZE, MultipartFileStream, OpResult, TransferProgress,
+                         error_result, multipart_envelope, remote_key)
+from ray5_metrics import METRICS
+
+log = logging.getLogger("ray5.async")
+
+
+class HTTPError(Exception):
+    pass
+
+
+class _Connection:
+    __slots__ = ("reader", "writer", "reused")
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncConnectionPool:
+    """Keep-alive connections to one host, with at most `limit` requests in flight."""
+
+    def __init__(self, host, port, limit=2):
+        self.host = host
+        self.port = port
+        self.limit = limit
+        self._idle = []
+        self._slots = None
+
+    @property
+    def slots(self):
+        # Created lazily so the pool binds to the loop that first uses it
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.limit)
+        return self._slots
+
+    async def _acquire(self, timeout):
+        while self._idle:
+            conn = self._idle.pop()
+            if not conn.reader.at_eof() and not conn.writer.is_closing():
+                conn.reused = True
+                return conn
+            conn.close()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), timeout)
+        return _Connection(reader, writer)
+
+    async def request(self, method, target, headers=None, body=None, timeout=5):
+        """Send one request; `body` may be bytes or a MultipartFileStream. Returns (status, bytes)."""
+        async with self.slots:
+            for attempt in range(2):
+                conn = await self._acquire(timeout)
+                try:
+                    status, data, keep = await self._exchange(conn, method, target, headers, body, timeout)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    conn.close()
+                    # The laser may have dropped an idle keep-alive socket; retry GETs once on a fresh one
+                    if conn.reused and method == "GET" and attempt == 0:
+                        log.debug(f"Retrying {target} on a new connection: {e}")
+                        continue
+                    raise
+                except BaseException:
+                    # Timeouts and cancellation leave the stream in an unknown state
+                    conn.close()
+                    raise
+                if keep:
+                    self._idle.append(conn)
+                else:
+                    conn.close()
+                return status, data
+
+    async def _exchange(self, conn, method, target, headers, body, timeout):
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {self.host}:{self.port}", "Connection: keep-alive"]
+        for key, value in (headers or {}).items():
+            lines.append(f"{key}: {value}")
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        conn.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("utf-8"))
+        if isinstance(body, (bytes, bytearray)):
+            conn.writer.write(body)
+        elif hasattr(body, "aread"):
+            while True:
+                chunk = await body.aread()
+                if not chunk:
+                    break
+                conn.writer.write(chunk)
+                await asyncio.wait_for(conn.writer.drain(), timeout)
+        elif body is not None:
+            while True:
+                chunk = body.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                conn.writer.write(chunk)
+                await asyncio.wait_for(conn.writer.drain(), timeout)
+        await asyncio.wait_for(conn.writer.drain(), timeout)
+        return await asyncio.wait_for(self._read_response(conn.reader), timeout)
+
+    async def _read_response(self, reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("iso-8859-1").split("\r\n")
+        parts = lines[0].split(" ", 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise HTTPError(f"Malformed status line: {lines[0]!r}")
+        status = int(parts[1])
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+        keep = headers.get("connection", "").lower() != "close" and parts[0] != "HTTP/1.0"
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readuntil(b"\r\n")
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b"".join(chunks)
+        elif "content-length" in headers:
+            data = await reader.readexactly(int(headers["content-length"]))
+        else:
+            data = await reader.read()
+            keep = False
+        return status, data, keep
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+def response_result(op, status, data, start, sent=0, keep_text=True):
+    ok = status == 200
+    return OpResult(op, ok, status, time.perf_counter() - start, sent + len(data),
+                    None if ok else "http_error", None if ok else f"HTTP {status}",
+                    data.decode("utf-8", errors="replace") if keep_text else "")
+
+
+class AsyncRay5Client:
+    def __init__(self, ip="192.168.1.101", port=8848, max_concurrency=2, timeouts=None, metrics=METRICS):
+        self.ip = ip
+        self.port = port
+        self.base_url = f"http://{ip}:{port}"
+        self.mac = None
+        self.metrics = metrics
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self.pool = AsyncConnectionPool(ip, port, max_concurrency)
+
+    async def close(self):
+        await self.pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _timeout(self, kind, timeout):
+        return self.timeouts[kind] if timeout is None else timeout
+
+    def _record(self, endpoint, result):
+        if self.metrics is not None:
+            self.metrics.record(self.ip, endpoint, result)
+        return result
+
+    async def get_files(self, path="/", timeout=None):
+        listing = await self.get_listing(path, timeout)
+        return listing.get("files", []) if listing else []
+
+    async def upload_file(self, local_path, remote_path="/", timeout=None, progress=None):
+        filename = os.path.basename(local_path)
+        start = time.perf_counter()
+        try:
+            filesize = os.path.getsize(local_path)
+            data = {
+                'path': remote_path,
+                'size': str(filesize)
+            }
+            body = MultipartFileStream(data, 'file', filename, local_path, callback=progress)
+        except OSError as e:
+            log.error(f"Upload error for {filename}: {e!r}")
+            return error_result("upload", e, start)
+        try:
+            return await self.upload_body(filename, body, remote_path, timeout)
+        finally:
+            body.close()
+
+    async def upload_body(self, filename, body, remote_path="/", timeout=None):
+        """POST a prepared multipart body (MultipartFileStream or FanOutBody)."""
+        encoded_path = urllib.parse.quote(remote_path)
+        start = time.perf_counter()
+        try:
+            status, text = await self.pool.request(
+                "POST", f"/upload?path={encoded_path}", {"Content-Type": body.content_type}, body,
+                timeout=self._timeout("upload", timeout))
+            result = self._record("/upload", response_result("upload", status, text, start, body.progress.sent))
+            if result.ok:
+                log.info(f"Uploaded {filename} to {self.ip} successfully")
+            else:
+                log.error(f"Upload to {self.ip} failed: {status} {text[:200]!r}")
+            return result
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error(f"Upload error for {filename} on {self.ip}: {e!r}")
+            return self._record("/upload", error_result("upload", e, start, body.progress.sent))
+
+    async def delete_file(self, filename, path="/", timeout=None):
+        start = time.perf_counter()
+        try:
+            encoded_filename = urllib.parse.quote(remote_key(path, filename))
+            status, data = await self.pool.request("GET", f"/command?commandText=$SD/Delete={encoded_filename}",
+                                                   timeout=self._timeout("delete", timeout))
+            result = self._record("/command", response_result("delete", status, data, start))
+            if result.ok:
+                log.info(f"Deleted {filename} on {self.ip} successfully")
+            else:
+                log.error(f"Delete failed for {filename} on {self.ip}: HTTP {status}")
+            return result
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error(f"Delete error for {filename} on {self.ip}: {e!r}")
+            return self._record("/command", error_result("delete", e, start))
+
+    async def get_listing(self, path="/", timeout=None):
+        """Full /files response (files plus SD total/used/occupation), or None on failure."""
+        start = time.perf_counter()
+        try:
+            encoded_path = urllib.parse.quote(path)
+            status, data = await self.pool.request("GET", f"/files?path={encoded_path}",
+                                                   timeout=self._timeout("files", timeout))
+            self._record("/files", response_result("files", status, data, start, keep_text=False))
+            if status == 200:
+                return json.loads(data.decode('utf-8', errors='ignore'))
+            log.error(f"Failed to get listing from {self.ip}: HTTP {status}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._record("/files", error_result("files", e, start))
+            log.error(f"Error getting listing from {self.ip}: {e!r}")
+        return None
+
+    async def send_command(self, cmd, timeout=None):
+        start = time.perf_counter()
+        try:
+            encoded_cmd = urllib.parse.quote(cmd)
+            status, data = await self.pool.request("GET", f"/command?plain={encoded_cmd}",
+                                                   timeout=self._timeout("command", timeout))
+            return self._record("/command", response_result("command", status, data, start))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error(f"Command error on {self.ip} ({cmd}): {e!r}")
+            return self._record("/command", error_result("command", e, start))
+
+
+class FanOutBody:
+    """Multipart body fed from a shared reader, one instance per receiving laser.
+
+    broadcast_upload reads each block from disk once and puts it on every body's
+    small bounded queue, so memory stays at a few blocks per laser and the
+    slowest laser sets the pace.
+    """
+
+    def __init__(self, fields, filename, size, callback=None, depth=8):
+        self.content_type, self._head, self._tail = multipart_envelope(fields, 'file', filename)
+        self.queue = asyncio.Queue(maxsize=depth)
+        self.progress = TransferProgress(filename, size)
+        self.callback = callback
+        self.alive = True
+        self._length = len(self._head) + size + len(self._tail)
+        self._state = "head"
+
+    def __len__(self):
+        return self._length
+
+    async def aread(self):
+        if self._state == "head":
+            self._state = "body"
+            return self._head
+        if self._state == "body":
+            chunk = await self.queue.get()
+            if chunk is not None:
+                self.progress.sent += len(chunk)
+                if self.callback:
+                    self.callback(self.progress)
+                return chunk
+            self._state = "tail"
+            return self._tail
+        self._state = "done"
+        return b""
+
+    def abandon(self):
+        # Receiver finished early (error or cancel): stop feeding it and unblock the reader
+        self.alive = False
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+async def broadcast_upload(clients, local_path, remote_path="/", timeout=None, progress=None):
+    """Upload one file to many lasers, reading it from disk once.
+
+    `progress(ip, TransferProgress)` is called per laser. Returns {ip: OpResult}.
+    """
+    filename = os.path.basename(local_path)
+    start = time.perf_counter()
+    try:
+        f = open(local_path, "rb")
+        size = os.fstat(f.fileno()).st_size
+    except OSError as e:
+        # Missing or unreadable: a local_io result for every laser, like Ray5Client.upload_file
+        log.error(f"Upload error for {filename}: {e!r}")
+        return {c.ip: error_result("upload", e, start) for c in clients}
+    fields = {'path': remote_path, 'size': str(size)}
+    bodies = []
+    tasks = []
+    for client in clients:
+        callback = (lambda p, ip=client.ip: progress(ip, p)) if progress else None
+        body = FanOutBody(fields, filename, size, callback)
+        task = asyncio.ensure_future(client.upload_body(filename, body, remote_path, timeout))
+        task.add_done_callback(lambda _, b=body: b.abandon())
+        bodies.append(body)
+        tasks.append(task)
+    try:
+        with f:
+            while any(b.alive for b in bodies):
+                chunk = f.read(UPLOAD_CHUNK_SIZE)
+                for body in bodies:
+                    if body.alive:
+                        await body.queue.put(chunk or None)
+                if not chunk:
+                    break
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return {c.ip: (r if isinstance(r, OpResult) else error_result("upload", r, time.perf_counter()))
+            for c, r in zip(clients, results)}
+
+
+def async_client_from_config(config, ip, port=8848):
+    return AsyncRay5Client(
+        ip,
+        port,
+        max_concurrency=config.get("pool_size", 2),
+        timeouts=config.get("timeouts"),
+    )
+
+
+class AsyncLoopThread:
+    """One asyncio loop on a daemon thread; submit() returns a concurrent.futures.Future."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
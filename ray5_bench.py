@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""Benchmarks for Ray5Client against the local simulator (ray5_sim).
+
+    python ray5_bench.py                          run everything, print a summary
+    python ray5_bench.py command listing -o run.json
+    python ray5_bench.py --compare baseline.json  fail (exit 1) on regressions
+
+Every result has a primary "value" and whether lower or higher is better, so two
+JSON runs can be compared directly.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import requests
+
+from ray5_analyze import HAS_NUMPY, analyze_file
+from ray5_client import Ray5Client
+from ray5_discovery import scan_hosts, find_laser
+from ray5_gcode import minify_file, verify
+from ray5_raster import RASTER_DEFAULTS, gcode_chunks, power_map
+from ray5_sim import Ray5Simulator
+from ray5_validate import validate_file
+
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+DEFAULT_UPLOAD_SIZES = "1K,64K,1M,16M,128M,500M"
+DEFAULT_LISTING_SIZES = "10,1000,10000"
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    if text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def percentile(sorted_samples, pct):
+    # Nearest-rank percentile
+    if not sorted_samples:
+        return None
+    rank = max(1, min(len(sorted_samples), round(pct / 100 * len(sorted_samples) + 0.5)))
+    return sorted_samples[rank - 1]
+
+
+def latency_result(samples):
+    ordered = sorted(samples)
+    return {
+        "unit": "ms",
+        "better": "lower",
+        "n": len(ordered),
+        "value": percentile(ordered, 50),
+        "p50": percentile(ordered, 50),
+        "p95": percentile(ordered, 95),
+        "p99": percentile(ordered, 99),
+        "mean": statistics.mean(ordered),
+        "max": ordered[-1],
+    }
+
+
+def time_calls(fn, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def new_simulator(args, **kwargs):
+    return Ray5Simulator(latency=args.latency, bandwidth=args.bandwidth, **kwargs)
+
+
+def bench_session(args):
+    """Fresh TCP connection per call (old behaviour) vs the pooled session."""
+    with new_simulator(args) as sim:
+        url = f"http://{sim.host}:{sim.port}/command?plain=%5BESP400%5D"
+        fresh = time_calls(lambda: requests.get(url, timeout=5), args.count)
+        with Ray5Client(sim.host, sim.port) as client:
+            pooled = time_calls(lambda: client.send_command("[ESP400]"), args.count)
+    return {"session_fresh": latency_result(fresh), "session_pooled": latency_result(pooled)}
+
+
+def bench_command(args):
+    with new_simulator(args) as sim, Ray5Client(sim.host, sim.port) as client:
+        client.send_command("[ESP400]")
+        samples = time_calls(lambda: client.send_command("[ESP400]"), args.count)
+    return {"send_command": latency_result(samples)}
+
+
+def bench_listing(args):
+    results = {}
+    for entries in (int(n) for n in args.listing_sizes.split(",")):
+        with new_simulator(args) as sim, Ray5Client(sim.host, sim.port) as client:
+            sim.sd.populate(entries)
+            if len(client.get_files()) != entries:
+                raise RuntimeError(f"listing returned the wrong number of entries for {entries}")
+            # Keep big listings from dominating the run time
+            count = max(5, min(args.count, 200_000 // max(entries, 1)))
+            results[f"get_files_{entries}"] = latency_result(time_calls(client.get_files, count))
+    return results
+
+
+def bench_delete(args):
+    batch = args.delete_batch
+    with new_simulator(args) as sim, Ray5Client(sim.host, sim.port) as client:
+        sim.sd.populate(batch, prefix="old")
+        names = [f"old_{i:05d}.gcode" for i in range(batch)]
+        samples = []
+        start = time.perf_counter()
+        for name in names:
+            t = time.perf_counter()
+            client.delete_file(name)
+            samples.append((time.perf_counter() - t) * 1000)
+        total = time.perf_counter() - start
+        if sim.sd.files:
+            raise RuntimeError(f"{len(sim.sd.files)} files left after delete batch")
+    result = latency_result(samples)
+    result["batch"] = batch
+    result["batch_seconds"] = total
+    result["ops_per_second"] = batch / total if total else None
+    results = {f"delete_batch_{batch}": result}
+
+    # Same batch through delete_files with the default window (one request per pooled connection)
+    with new_simulator(args) as sim, Ray5Client(sim.host, sim.port) as client:
+        sim.sd.populate(batch, prefix="old")
+        start = time.perf_counter()
+        outcome = client.delete_files(names)
+        total = time.perf_counter() - start
+        if sim.sd.files or not all(r.ok for r in outcome.values()):
+            raise RuntimeError(f"{len(sim.sd.files)} files left after parallel delete batch")
+    results[f"delete_parallel_{batch}"] = {"unit": "ops/s", "better": "higher", "n": batch,
+                                           "value": batch / total, "batch_seconds": total,
+                                           "window": client.pool_size}
+    return results
+
+
+def write_test_file(path, size):
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            n = min(remaining, len(block))
+            f.write(block[:n])
+            remaining -= n
+
+
+def bench_upload(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, new_simulator(args) as sim, \
+            Ray5Client(sim.host, sim.port, timeouts={"upload": 600}) as client:
+        for label in (part.strip() for part in args.upload_sizes.split(",")):
+            size = parse_size(label)
+            path = os.path.join(tmp, f"bench_{label}.gcode")
+            write_test_file(path, size)
+            # Repeat small files for a stable number; anything over 64 MB runs once
+            repeats = max(1, min(args.upload_repeats, (64 * 1024 ** 2) // max(size, 1)))
+            seconds = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                res = client.upload_file(path)
+                seconds.append(time.perf_counter() - start)
+                if not res.ok:
+                    raise RuntimeError(f"upload of {label} failed: {res}")
+            os.remove(path)
+            median = statistics.median(seconds)
+            results[f"upload_{label}"] = {
+                "unit": "MB/s",
+                "better": "higher",
+                "n": repeats,
+                "bytes": size,
+                "value": size / median / 1e6,
+                "seconds_median": median,
+            }
+    return results
+
+
+def write_raster_gcode(path, size):
+    """LightBurn-style line raster: a G1 with X, Y, F and S on every pixel run."""
+    with open(path, "w") as f:
+        f.write("; LightBurn 1.4\nG00 G17 G40 G21 G54\nG90\nM4\n")
+        row = 0
+        while f.tell() < size:
+            y = row * 0.1
+            f.write(f"G0 X0.000 Y{y:.3f} S0\n")
+            for k in range(1, 200):
+                f.write(f"G1 X{k * 0.2:.3f} Y{y:.3f} F6000 S{(k * 37 + row) % 5 * 250}\n")
+            row += 1
+        f.write("M5\nM2\n")
+
+
+def bench_minify(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in (part.strip() for part in args.minify_sizes.split(",")):
+            src = os.path.join(tmp, f"raster_{label}.gcode")
+            dst = os.path.join(tmp, f"raster_{label}.min.gcode")
+            write_raster_gcode(src, parse_size(label))
+            with open(dst, "wb") as f:
+                report = minify_file(src, f)
+            ok, message = verify(src, dst)
+            if not ok:
+                raise RuntimeError(f"minified {label} is not equivalent: {message}")
+            results[f"minify_{label}"] = {
+                "unit": "MB/s",
+                "better": "higher",
+                "n": 1,
+                "bytes": report.bytes_in,
+                "value": report.bytes_in / report.elapsed / 1e6,
+                "saved_percent": report.percent,
+            }
+    return results
+
+
+def bench_analyze(args):
+    if not HAS_NUMPY:
+        raise RuntimeError("numpy is not installed")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in (part.strip() for part in args.analyze_sizes.split(",")):
+            path = os.path.join(tmp, f"raster_{label}.gcode")
+            write_raster_gcode(path, parse_size(label))
+            analysis = analyze_file(path)
+            results[f"analyze_{label}"] = {
+                "unit": "Mlines/s",
+                "better": "higher",
+                "n": 1,
+                "lines": analysis.lines,
+                "value": analysis.lines / analysis.elapsed / 1e6,
+                "seconds": analysis.elapsed,
+            }
+    return results
+
+
+def bench_validate(args):
+    if not HAS_NUMPY:
+        raise RuntimeError("numpy is not installed")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in (part.strip() for part in args.validate_sizes.split(",")):
+            path = os.path.join(tmp, f"raster_{label}.gcode")
+            write_raster_gcode(path, parse_size(label))
+            report = validate_file(path)
+            results[f"validate_{label}"] = {
+                "unit": "MB/s",
+                "better": "higher",
+                "n": 1,
+                "lines": report.lines,
+                "value": os.path.getsize(path) / report.elapsed / 1e6,
+                "seconds": report.elapsed,
+            }
+    return results
+
+
+def bench_raster(args):
+    """Dither a synthetic gradient photo and generate its G-code, without Pillow."""
+    if not HAS_NUMPY:
+        raise RuntimeError("numpy is not installed")
+    import numpy as np
+    results = {}
+    for label in (part.strip() for part in args.raster_sizes.split(",")):
+        w, h = (int(v) for v in label.split("x"))
+        yy, xx = np.mgrid[0:h, 0:w]
+        gray = (xx / w + 0.2 * np.sin(yy / 17.0)) % 1.0
+        for mode in ("floyd", "grayscale"):
+            settings = dict(RASTER_DEFAULTS, mode=mode)
+            start = time.perf_counter()
+            size = sum(len(chunk) for chunk in gcode_chunks(power_map(gray, settings), settings))
+            elapsed = time.perf_counter() - start
+            results[f"raster_{mode}_{label}"] = {
+                "unit": "Mpx/s",
+                "better": "higher",
+                "n": 1,
+                "bytes": size,
+                "value": w * h / elapsed / 1e6,
+                "seconds": elapsed,
+            }
+    return results
+
+
+def bench_discovery(args, decoys=20):
+    """Sweep 127.0.0.0/24 for a simulated laser, with decoy lasers on other loopback aliases.
+
+    Every 127.x address is loopback on Linux, so each alias gets its own simulator on
+    the same port just like lasers on a real /24. Only timed here; that the right
+    laser is found is checked by test_ray5_discovery.py.
+    """
+    target_mac = "24:0A:C4:00:00:2A"
+    target = Ray5Simulator("127.0.0.200", 0, target_mac).start()
+    port = target.port
+    servers = [target]
+    for i in range(decoys):
+        servers.append(Ray5Simulator(f"127.0.0.{10 + i}", port, f"24:0A:C4:00:01:{i:02X}").start())
+
+    start = time.perf_counter()
+    found = find_laser(target_mac, cidr="127.0.0.0/24", port=port, concurrency=64, timeout=1.0)
+    elapsed = time.perf_counter() - start
+
+    for server in servers:
+        server.stop()
+    return {"discover_127_0_0_0_24": {"unit": "s", "better": "lower", "n": 1, "value": elapsed,
+                                      "hosts": len(scan_hosts("127.0.0.0/24")), "found": found and found[0]}}
+
+
+BENCHMARKS = {
+    "session": bench_session,
+    "command": bench_command,
+    "listing": bench_listing,
+    "delete": bench_delete,
+    "upload": bench_upload,
+    "minify": bench_minify,
+    "analyze": bench_analyze,
+    "validate": bench_validate,
+    "raster": bench_raster,
+    "discover": bench_discovery,
+}
+
+
+def compare(current, baseline, threshold):
+    """Print old -> new for every shared metric; returns the names that regressed beyond threshold."""
+    regressions = []
+    for name, result in current.items():
+        old = baseline.get(name)
+        if not old or not old.get("value") or result.get("value") is None:
+            continue
+        change = (result["value"] - old["value"]) / old["value"]
+        worse = change > threshold if result["better"] == "lower" else change < -threshold
+        flag = "REGRESSION" if worse else ""
+        print(f"{name:<28} {old['value']:>12.3f} -> {result['value']:>12.3f} {result['unit']:<5} "
+              f"{change:+8.1%} {flag}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def print_summary(results):
+    for name, r in results.items():
+        if r["unit"] == "ms":
+            print(f"{name:<28} p50 {r['p50']:8.3f}  p95 {r['p95']:8.3f}  p99 {r['p99']:8.3f} ms  (n={r['n']})")
+        else:
+            print(f"{name:<28} {r['value']:10.3f} {r['unit']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ray5 connector benchmarks against the local Ray5 simulator")
+    parser.add_argument("benchmarks", nargs="*", metavar="BENCH",
+                        help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("-n", "--count", type=int, default=500, help="samples per latency benchmark")
+    parser.add_argument("--listing-sizes", default=DEFAULT_LISTING_SIZES, help="comma separated entry counts")
+    parser.add_argument("--upload-sizes", default=DEFAULT_UPLOAD_SIZES, help="comma separated sizes, e.g. 1K,1M,500M")
+    parser.add_argument("--upload-repeats", type=int, default=5, help="max uploads per size")
+    parser.add_argument("--minify-sizes", default="16M", help="comma separated raster G-code sizes to minify")
+    parser.add_argument("--analyze-sizes", default="64M", help="comma separated raster G-code sizes to analyse")
+    parser.add_argument("--validate-sizes", default="64M", help="comma separated raster G-code sizes to check")
+    parser.add_argument("--raster-sizes", default="2000x1500", help="comma separated image sizes in pixels, WxH")
+    parser.add_argument("--delete-batch", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated per-request latency, seconds")
+    parser.add_argument("--bandwidth", type=float, default=None, help="simulated bandwidth cap, bytes/s")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    selected = args.benchmarks or list(BENCHMARKS)
+    unknown = [b for b in selected if b not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    results = {}
+    for name in selected:
+        results.update(BENCHMARKS[name](args))
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "benchmarks": selected,
+            "latency": args.latency,
+            "bandwidth": args.bandwidth,
+        },
+        "results": results,
+    }
+    print_summary(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
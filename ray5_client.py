@@ -0,0 +1,950 @@
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import hashlib
+import random
+import time
+import os
+import posixpath
+import threading
+import logging
+import urllib.parse
+import uuid
+from dataclasses import dataclass
+
+from ray5_gcode import minifier_from_config
+from ray5_metrics import METRICS
+
+log = logging.getLogger("ray5.client")
+upload_log = logging.getLogger("ray5.upload")
+keepalive_log = logging.getLogger("ray5.keepalive")
+
+# Shared with the GUI; relative to the working directory like connector.log
+CONFIG_PATH = "config.json"
+
+def load_config(path=CONFIG_PATH):
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            log.error(f"Failed to load config: {e}")
+    return {}
+
+def config_file(name, config_path=CONFIG_PATH):
+    """Path of a state file kept next to the config file, whatever the working directory."""
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), name)
+
+def save_config(config, path=CONFIG_PATH):
+    try:
+        with open(path, "w") as f:
+            json.dump(config, f)
+    except Exception as e:
+        log.error(f"Failed to save config: {e}")
+
+# Default per-call timeouts in seconds, keyed by operation
+DEFAULT_TIMEOUTS = {
+    "files": 5,
+    "upload": 60,
+    "delete": 5,
+    "command": 5,
+}
+
+# Upload bodies are streamed from disk in blocks of this size
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+class TransferProgress:
+    """Byte counter for one transfer with rate and ETA estimates."""
+
+    def __init__(self, name, total):
+        self.name = name
+        self.total = total
+        self.sent = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        elapsed = self.elapsed
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        rate = self.rate
+        return (self.total - self.sent) / rate if rate > 0 else None
+
+    @property
+    def fraction(self):
+        return self.sent / self.total if self.total else 1.0
+
+def multipart_envelope(fields, field_name, filename):
+    """Return (content_type, head, tail) bytes surrounding one file part."""
+    boundary = uuid.uuid4().hex
+    safe_name = filename.replace('"', "%22")
+    head = []
+    for key, value in fields.items():
+        head.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'
+        )
+    head.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field_name}"; filename="{safe_name}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    )
+    tail = f"\r\n--{boundary}--\r\n"
+    return f"multipart/form-data; boundary={boundary}", "".join(head).encode("utf-8"), tail.encode("ascii")
+
+class MultipartFileStream:
+    """multipart/form-data body that streams one file from disk.
+
+    requests sends any object with read() and __len__ as the request body with a
+    Content-Length header, so only one chunk of the file is in memory at a time.
+    With a `transform` (see ray5_gcode.GcodeMinifier) the file is rewritten on
+    the fly as it is sent.
+    """
+
+    def __init__(self, fields, field_name, filename, local_path, chunk_size=UPLOAD_CHUNK_SIZE, callback=None,
+                 transform=None):
+        self.content_type, self._head, self._tail = multipart_envelope(fields, field_name, filename)
+        self.chunk_size = chunk_size
+        self.callback = callback
+        
+        if transform is not None:
+            self.progress = TransferProgress(filename, transform.output_size(local_path))
+            self._file = transform.open(local_path)
+        else:
+            self.progress = TransferProgress(filename, os.path.getsize(local_path))
+            self._file = open(local_path, "rb")
+        self._length = len(self._head) + self.progress.total + len(self._tail)
+        self._pending = self._head
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        if self._pending:
+            out, self._pending = self._pending[:size], self._pending[size:]
+            return out
+        if self._file is not None:
+            chunk = self._file.read(size)
+            if chunk:
+                self.progress.sent += len(chunk)
+                if self.callback:
+                    self.callback(self.progress)
+                return chunk
+            self._file.close()
+            self._file = None
+            self._pending, self._tail = self._tail, b""
+            return self.read(size)
+        return b""
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class UploadError(Exception):
+    def __init__(self, message, category, http_code=None):
+        super().__init__(message)
+        self.category = category
+        self.http_code = http_code
+
+def classify_error(exc):
+    """Map an exception to timeout / connection_reset / connection / http_error / local_io."""
+    if isinstance(exc, UploadError):
+        return exc.category
+    if isinstance(exc, requests.exceptions.Timeout) or type(exc).__name__ == "TimeoutError":
+        return "timeout"
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        # requests wraps the socket error a few levels deep
+        pending = [exc]
+        while pending:
+            e = pending.pop()
+            if isinstance(e, (ConnectionResetError, BrokenPipeError, ConnectionAbortedError)):
+                return "connection_reset"
+            if type(e).__name__ in ("RemoteDisconnected", "ProtocolError"):
+                return "connection_reset"
+            pending.extend(a for a in getattr(e, "args", ()) if isinstance(a, BaseException))
+            if e.__cause__ is not None:
+                pending.append(e.__cause__)
+        return "connection"
+    if isinstance(exc, (ConnectionResetError, BrokenPipeError, ConnectionAbortedError)) \
+            or type(exc).__name__ == "IncompleteReadError":
+        return "connection_reset"
+    if isinstance(exc, ConnectionError):
+        return "connection"
+    if isinstance(exc, OSError):
+        return "local_io"
+    return "unknown"
+
+# Messages the old string results used, kept for str(result) in logs and CLI output
+RESULT_LABELS = {
+    "upload": ("Upload", "Upload successful"),
+    "delete": ("Delete", "Delete command sent"),
+    "command": ("Command", None),
+}
+
+@dataclass(slots=True)
+class OpResult:
+    """Outcome of one upload, delete or command request.
+
+    `ok` is true only for an HTTP 200; `category` is set when it isn't
+    ("http_error" or one of classify_error's transport categories).
+    """
+    op: str
+    ok: bool
+    http_code: int | None = None
+    elapsed: float = 0.0
+    bytes: int = 0
+    category: str | None = None
+    error: str | None = None
+    text: str = ""
+
+    @property
+    def status(self):
+        if self.ok:
+            return "ok"
+        return "failed" if self.category == "http_error" else "error"
+
+    def __str__(self):
+        label, success = RESULT_LABELS.get(self.op, (self.op.capitalize(), None))
+        if self.ok:
+            return success or self.text
+        if self.category == "http_error":
+            return f"{label} failed: {self.http_code}"
+        return f"{label} error: {self.error}"
+
+def http_result(op, r, start, sent=0, keep_text=True):
+    ok = r.status_code == 200
+    return OpResult(op, ok, r.status_code, time.perf_counter() - start, sent + len(r.content),
+                    None if ok else "http_error", None if ok else f"HTTP {r.status_code}",
+                    r.text if keep_text else "")
+
+def error_result(op, exc, start, sent=0):
+    return OpResult(op, False, None, time.perf_counter() - start, sent, classify_error(exc), str(exc))
+
+class Ray5Client:
+    def __init__(self, ip="192.168.1.101", port=8848, pool_size=2, timeouts=None, metrics=METRICS, listings=None,
+                 transform=None):
+        self.ip = ip
+        self.port = port
+        self.base_url = f"http://{ip}:{port}"
+        self.mac = None
+        self.metrics = metrics
+        self.pool_size = pool_size
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        
+        # One pooled keep-alive session per laser. The ESP32 only has a handful of
+        # sockets, so the pool blocks instead of opening extra connections.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self.session.mount("http://", adapter)
+        
+        # Shared with the app so a reconnect to the same laser starts from the last listing
+        self.listings = listings if listings is not None else ListingCache()
+        # Optional pre-upload rewrite of file contents, e.g. the G-code minifier
+        self.transform = transform
+        self._revalidating = {}
+        self._revalidate_lock = threading.Lock()
+        self._revalidator = None
+        # OpResult of the last /files request that failed
+        self.last_listing_error = None
+
+    def close(self):
+        if self._revalidator is not None:
+            self._revalidator.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _timeout(self, kind, timeout):
+        return self.timeouts[kind] if timeout is None else timeout
+
+    def _record(self, endpoint, result):
+        if self.metrics is not None:
+            self.metrics.record(self.ip, endpoint, result)
+        return result
+
+    def get_files(self, path="/", timeout=None):
+        files = self.list_files(path, timeout)
+        return files if files is not None else []
+
+    def list_files(self, path="/", timeout=None):
+        """Fresh SD listing of `path` as a list of {"name", "size", ...} dicts.
+
+        Returns None when the request fails, so an unreachable laser doesn't look
+        like an empty card; the OpResult of the failure is kept in
+        `last_listing_error`. A successful listing also updates the cache.
+        """
+        start = time.perf_counter()
+        version = self.listings.version(path)
+        try:
+            encoded_path = urllib.parse.quote(path)
+            r = self.session.get(f"{self.base_url}/files?path={encoded_path}", timeout=self._timeout("files", timeout))
+            # Listings can be large; don't decode them twice
+            result = self._record("/files", http_result("files", r, start, keep_text=False))
+            if r.status_code == 200:
+                data = json.loads(r.content.decode('utf-8', errors='ignore'))
+                files = data.get("files", [])
+                self.listings.put(path, files, version)
+                return files
+            log.error(f"Failed to get files: HTTP {r.status_code}")
+        except Exception as e:
+            result = self._record("/files", error_result("files", e, start))
+            log.error(f"Error getting files: {e}")
+        self.last_listing_error = result
+        return None
+
+    def cached_files(self, path="/", on_update=None, force=False):
+        """Stale-while-revalidate listing of `path`.
+
+        Returns the cached listing straight away (None if there is none) and, when
+        it is older than the cache TTL or `force` is set, refetches it on a
+        background thread. `on_update(path, files)` is called from that thread if
+        the fetched listing differs from what was returned.
+        """
+        found = self.listings.lookup(path)
+        if force or found is None or found[1] > self.listings.ttl:
+            self.revalidate(path, on_update, found[0] if found else None)
+        return found[0] if found else None
+
+    def revalidate(self, path="/", on_update=None, known=None):
+        with self._revalidate_lock:
+            callbacks = self._revalidating.get(path)
+            if callbacks is not None:
+                # Already fetching this folder; just report to this caller too
+                if on_update:
+                    callbacks.append((on_update, known))
+                return
+            self._revalidating[path] = [(on_update, known)] if on_update else []
+            if self._revalidator is None:
+                self._revalidator = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ray5-revalidate")
+            self._revalidator.submit(self._revalidate, path)
+
+    def _revalidate(self, path):
+        try:
+            files = self.list_files(path)
+        finally:
+            with self._revalidate_lock:
+                callbacks = self._revalidating.pop(path, [])
+        if files is None:
+            return
+        # A local mutation may have landed meanwhile; report what the cache holds now
+        current = self.listings.lookup(path)
+        files = current[0] if current else files
+        for on_update, known in callbacks:
+            if files != known:
+                on_update(path, files)
+
+    def upload_transform(self, local_path):
+        if self.transform is not None and self.transform.applies(local_path):
+            return self.transform
+        return None
+
+    def upload_size(self, local_path, transform=None):
+        """Size `local_path` will have on the SD card after the upload transform."""
+        transform = transform or self.upload_transform(local_path)
+        return transform.output_size(local_path) if transform else os.path.getsize(local_path)
+
+    def upload_file(self, local_path, remote_path="/", timeout=None, progress=None, transform=None, filename=None):
+        """Stream `local_path` to the SD card; `progress` is called with a TransferProgress per chunk.
+
+        `transform` replaces the client's own (e.g. a RasterEngraver turning an
+        image into G-code) and `filename` the name it gets on the card.
+        """
+        filename = filename or os.path.basename(local_path)
+        transform = transform or self.upload_transform(local_path)
+        start = time.perf_counter()
+        body = None
+        try:
+            filesize = self.upload_size(local_path, transform)
+            encoded_path = urllib.parse.quote(remote_path)
+            url = f"{self.base_url}/upload?path={encoded_path}"
+            data = {
+                'path': remote_path,
+                'size': str(filesize)
+            }
+            body = MultipartFileStream(data, 'file', filename, local_path, callback=progress, transform=transform)
+            headers = {'Content-Type': body.content_type}
+            r = self.session.post(url, data=body, headers=headers, timeout=self._timeout("upload", timeout))
+            result = self._record("/upload", http_result("upload", r, start, body.progress.sent))
+            if result.ok:
+                self.listings.mutate(remote_path, lambda files: with_file(files, filename, filesize))
+                log.info(f"Uploaded {filename} successfully ({filesize / max(result.elapsed, 1e-6) / 1e6:.2f} MB/s)")
+            else:
+                log.error(f"Upload failed: {r.status_code} {r.text}")
+            return result
+        except Exception as e:
+            log.error(f"Upload error for {filename}: {e}")
+            return self._record("/upload", error_result("upload", e, start, body.progress.sent if body else 0))
+        finally:
+            if body is not None:
+                body.close()
+
+    def delete_file(self, filename, path="/", timeout=None):
+        start = time.perf_counter()
+        try:
+            # Manufacturer uses /command?commandText=$SD/Delete=filename; subfolders need the full path
+            encoded_filename = urllib.parse.quote(remote_key(path, filename))
+            url = f"{self.base_url}/command?commandText=$SD/Delete={encoded_filename}"
+            r = self.session.get(url, timeout=self._timeout("delete", timeout))
+            result = self._record("/command", http_result("delete", r, start))
+            if result.ok:
+                self.listings.mutate(path, lambda files: without_file(files, filename))
+                log.info(f"Deleted {filename} successfully")
+            else:
+                log.error(f"Delete failed for {filename}: HTTP {r.status_code}")
+            return result
+        except Exception as e:
+            log.error(f"Delete error for {filename}: {e}")
+            return self._record("/command", error_result("delete", e, start))
+
+    def delete_files(self, filenames, path="/", window=None, on_result=None, timeout=None):
+        """Delete many files with up to `window` requests in flight on the pooled connections.
+
+        `on_result(filename, OpResult)` is called from a worker thread as each
+        delete is answered. Returns {filename: OpResult}.
+        """
+        window = max(1, min(window or self.pool_size, self.pool_size, len(filenames) or 1))
+        results = {}
+        with ThreadPoolExecutor(max_workers=window, thread_name_prefix="ray5-delete") as pool:
+            futures = {pool.submit(self.delete_file, name, path, timeout): name for name in filenames}
+            for future in as_completed(futures):
+                name = futures[future]
+                results[name] = future.result()
+                if on_result:
+                    on_result(name, results[name])
+        return results
+
+    def send_command(self, cmd, timeout=None, logger=None):
+        # `logger` lets periodic callers (keepalive) report failures under their own rate-limited logger
+        start = time.perf_counter()
+        try:
+            encoded_cmd = urllib.parse.quote(cmd)
+            r = self.session.get(f"{self.base_url}/command?plain={encoded_cmd}", timeout=self._timeout("command", timeout))
+            return self._record("/command", http_result("command", r, start))
+        except Exception as e:
+            (logger or log).error(f"Command error ({cmd}): {e}")
+            return self._record("/command", error_result("command", e, start))
+
+def client_from_config(config, ip="192.168.1.101", port=8848, listings=None):
+    return Ray5Client(
+        ip,
+        port,
+        pool_size=config.get("pool_size", 2),
+        timeouts=config.get("timeouts"),
+        listings=listings,
+        transform=minifier_from_config(config),
+    )
+
+def format_esp_size(size):
+    # Same formatting ESP3D uses for the "size" field of /files
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.2f} KB"
+    if size < 1024 * 1024 * 1024:
+        return f"{size / 1024 / 1024:.2f} MB"
+    return f"{size / 1024 / 1024 / 1024:.2f} GB"
+
+def sizes_match(local_size, remote_size):
+    try:
+        return int(remote_size) == local_size
+    except (TypeError, ValueError):
+        return str(remote_size).strip().upper() == format_esp_size(local_size).upper()
+
+def is_dir(entry):
+    # ESP3D lists directories with size -1
+    return str(entry.get("size")) == "-1"
+
+def join_remote(folder, name):
+    return posixpath.join(folder or "/", name)
+
+def remote_key(folder, name):
+    # Root entries keep their bare names so existing manifests stay valid
+    if folder in (None, "", "/"):
+        return name
+    return join_remote(folder, name)
+
+class ListingCache:
+    """Directory listings by SD path; fresh for `ttl` seconds, stale (but still served) after.
+
+    Every path has a version that local mutations bump, so a fetch that was
+    already in flight when a file was uploaded or deleted can't overwrite the
+    newer state with what the laser said before the change.
+    """
+
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self.entries = {}
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def lookup(self, path):
+        """(files, age in seconds) or None. Lists are never modified in place."""
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry is None:
+            return None
+        return entry[1], time.monotonic() - entry[0]
+
+    def get(self, path):
+        found = self.lookup(path)
+        if found is None or found[1] > self.ttl:
+            return None
+        return found[0]
+
+    def version(self, path):
+        with self.lock:
+            return self.versions.get(path, 0)
+
+    def put(self, path, files, version=None):
+        """Store a fetched listing; returns False if `path` changed locally since `version` was read."""
+        with self.lock:
+            if version is not None and self.versions.get(path, 0) != version:
+                # Keep the local state but have the next reader fetch again
+                entry = self.entries.get(path)
+                if entry is not None:
+                    self.entries[path] = (float("-inf"), entry[1])
+                return False
+            self.entries[path] = (time.monotonic(), files)
+            return True
+
+    def mutate(self, path, fn):
+        """Replace the cached listing of `path` with fn(files), keeping its age."""
+        with self.lock:
+            self.versions[path] = self.versions.get(path, 0) + 1
+            entry = self.entries.get(path)
+            if entry is not None:
+                self.entries[path] = (entry[0], fn(entry[1]))
+
+    def invalidate(self, path=None):
+        with self.lock:
+            if path is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(path, None)
+
+def listing_size(files, size):
+    # Match the size format the laser already uses in this listing
+    for f in files:
+        value = str(f.get("size", ""))
+        if value != "-1":
+            return str(size) if value.isdigit() else format_esp_size(size)
+    return str(size)
+
+def with_file(files, name, size):
+    entry = {"name": name, "size": listing_size(files, size)}
+    for i, f in enumerate(files):
+        if f.get("name") == name:
+            return files[:i] + [{**f, **entry}] + files[i + 1:]
+    return files + [entry]
+
+def without_file(files, name):
+    return [f for f in files if f.get("name") != name]
+
+class UploadManifest:
+    """Content hashes of files this app uploaded, per laser, stored next to config.json.
+
+    An entry is only trusted while the remote listing still shows that file with
+    the size it had when we uploaded it; anything else invalidates it.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config_file("upload_manifest.json")
+        self.devices = {}
+        self.local = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.devices = data.get("devices", {})
+            self.local = data.get("local", {})
+        except Exception as e:
+            log.error(f"Failed to load upload manifest: {e}")
+
+    def save(self):
+        with self.lock:
+            data = {"devices": self.devices, "local": self.local}
+            tmp = self.path + ".tmp"
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+            except Exception as e:
+                log.error(f"Failed to save upload manifest: {e}")
+
+    def file_hash(self, path):
+        # Hashes are cached by size + mtime so unchanged files are read only once
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        cached = self.local.get(key)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE * 16), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self.lock:
+            self.local[key] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def plan(self, device, paths, listing, remote_path="/"):
+        """Split `paths` into (to_upload, unchanged) against the `listing` of `remote_path`.
+
+        With no listing (None: the request failed) nothing can be confirmed, so
+        everything is uploaded but the manifest is left as it is.
+        """
+        if listing is None:
+            return list(paths), []
+        remote = {remote_key(remote_path, f.get("name")): f.get("size") for f in listing}
+        folder = remote_key(remote_path, "")
+        with self.lock:
+            entries = self.devices.setdefault(device, {})
+            # Drop entries of this folder the SD card no longer agrees with
+            for key in list(entries):
+                if not key.startswith(folder) or "/" in key[len(folder):]:
+                    continue
+                expected = entries[key].get("remote_size", entries[key]["size"])
+                if key not in remote or not sizes_match(expected, remote[key]):
+                    del entries[key]
+        
+        to_upload, unchanged = [], []
+        for path in paths:
+            key = remote_key(remote_path, os.path.basename(path))
+            size = os.path.getsize(path)
+            entry = entries.get(key)
+            # The card may hold a minified copy; the entry remembers the size it was sent at
+            if (entry and key in remote and sizes_match(entry.get("remote_size", entry["size"]), remote[key])
+                    and entry["size"] == size and entry["sha256"] == self.file_hash(path)):
+                unchanged.append(path)
+            else:
+                to_upload.append(path)
+        return to_upload, unchanged
+
+    def record(self, device, path, remote_path="/", remote_size=None):
+        digest = self.file_hash(path)
+        size = os.path.getsize(path)
+        with self.lock:
+            self.devices.setdefault(device, {})[remote_key(remote_path, os.path.basename(path))] = {
+                "size": size,
+                "sha256": digest,
+                "remote_size": size if remote_size is None else remote_size,
+            }
+
+class UploadJob:
+    def __init__(self, local_path, remote_path="/", device=None, job_id=None, attempts=0, state="pending",
+                 category=None, last_error=None, created=None, filename=None, render=None, sent_size=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.local_path = local_path
+        self.remote_path = remote_path
+        # Name on the card when it differs from the local file, and raster
+        # settings when the upload is G-code rendered from an image
+        self.filename = filename
+        self.render = render
+        self.device = device
+        self.attempts = attempts
+        self.state = state
+        self.category = category
+        self.last_error = last_error
+        self.created = created or time.time()
+        self.next_try = 0.0
+        # Bytes written to the SD card by the last successful upload
+        self.uploaded_size = None
+        # Size of an upload the laser accepted but that is not verified yet;
+        # only the check is repeated while it matches the file
+        self.sent_size = sent_size
+        self._transform = None
+
+    @property
+    def name(self):
+        return self.filename or os.path.basename(self.local_path)
+
+    @property
+    def transform(self):
+        if self.render is not None and self._transform is None:
+            # Imported here so plain uploads and the CLI don't load numpy
+            from ray5_raster import shared_engraver
+            self._transform = shared_engraver(self.render)
+        return self._transform
+
+    def to_dict(self):
+        return {
+            "id": self.id, "local_path": self.local_path, "remote_path": self.remote_path,
+            "device": self.device, "attempts": self.attempts, "state": self.state,
+            "category": self.category, "last_error": self.last_error, "created": self.created,
+            "filename": self.filename, "render": self.render, "sent_size": self.sent_size,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["local_path"], d.get("remote_path", "/"), d.get("device"), d.get("id"),
+                   d.get("attempts", 0), d.get("state", "pending"), d.get("category"),
+                   d.get("last_error"), d.get("created"), d.get("filename"), d.get("render"), d.get("sent_size"))
+
+class UploadQueue:
+    """Ordered upload jobs with automatic retries, persisted next to config.json.
+
+    A worker thread uploads one job at a time whenever `is_active()` is true.
+    Failures are classified (timeout, connection_reset, connection, http_error,
+    size_mismatch, local_io); transient ones are retried with exponential backoff
+    and full jitter, up to `max_attempts`. After each upload the remote size in
+    the SD listing must match the size sent (after the client's upload transform);
+    if the listing itself fails, only the check is retried, not the upload.
+    Pending jobs survive restarts: they are reloaded from `path` and resume once a
+    laser is connected again. A job queued for one laser is only sent to that
+    laser: while `get_device()` returns another key it stays queued.
+
+    `notify(event, job)` is called from the worker thread with event one of
+    "queued", "started", "retry", "done", "failed"; `progress(job, TransferProgress)`
+    for each chunk sent.
+    """
+
+    RETRYABLE = {"timeout", "connection_reset", "connection", "http_error", "size_mismatch", "unknown"}
+
+    def __init__(self, get_client, is_active, path="upload_queue.json", max_attempts=6,
+                 backoff_base=2.0, backoff_cap=60.0, notify=None, progress=None, get_device=None):
+        self.get_client = get_client
+        self.is_active = is_active
+        self.get_device = get_device
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.notify = notify or (lambda event, job: None)
+        self.progress = progress
+        self.jobs = []
+        self.lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self.load()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def wake(self):
+        # Reconnected: retry waiting jobs now instead of after their backoff
+        with self.lock:
+            for job in self.jobs:
+                job.next_try = 0.0
+        self._wake_event.set()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                self.jobs = [UploadJob.from_dict(d) for d in json.load(f)]
+            for job in self.jobs:
+                # Interrupted mid-transfer by a restart: start that file over
+                job.state = "pending"
+            if self.jobs:
+                upload_log.info(f"Resuming {len(self.jobs)} pending upload(s)")
+        except Exception as e:
+            upload_log.error(f"Failed to load upload queue: {e}")
+
+    def save(self):
+        with self.lock:
+            data = [job.to_dict() for job in self.jobs]
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            upload_log.error(f"Failed to save upload queue: {e}")
+
+    def add(self, paths, remote_path="/", device=None, filename=None, render=None):
+        jobs = [UploadJob(os.path.abspath(p), remote_path, device, filename=filename, render=render) for p in paths]
+        with self.lock:
+            # A file that is still waiting will be read fresh when its turn comes
+            waiting = {(j.local_path, j.remote_path, j.name) for j in self.jobs if j.state == "pending"}
+            jobs = [j for j in jobs if (j.local_path, j.remote_path, j.name) not in waiting]
+            self.jobs.extend(jobs)
+        self.save()
+        for job in jobs:
+            self.notify("queued", job)
+        self._wake_event.set()
+        return jobs
+
+    def pending(self):
+        with self.lock:
+            return list(self.jobs)
+
+    def backoff(self, attempts):
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempts))
+
+    def _next_job(self):
+        now = time.time()
+        device = self.get_device() if self.get_device else None
+        with self.lock:
+            # Jobs for another laser wait until it is connected (wake() on connect)
+            jobs = [job for job in self.jobs if device is None or job.device in (None, device)]
+            for job in jobs:
+                if job.next_try <= now:
+                    return job, None
+            waits = [job.next_try - now for job in jobs]
+        return None, (min(waits) if waits else None)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            job, wait = (None, 1.0) if not self.is_active() else self._next_job()
+            if job is None:
+                self._wake_event.wait(wait)
+                self._wake_event.clear()
+                continue
+            self._attempt(job)
+
+    def _attempt(self, job):
+        client = self.get_client()
+        job.state = "uploading"
+        job.attempts += 1
+        self.notify("started", job)
+        try:
+            if not os.path.isfile(job.local_path):
+                raise UploadError("local file is missing", "local_io")
+            size = client.upload_size(job.local_path, job.transform)
+            if job.sent_size != size:
+                callback = (lambda p: self.progress(job, p)) if self.progress else None
+                result = client.upload_file(job.local_path, job.remote_path, progress=callback,
+                                            transform=job.transform, filename=job.filename)
+                if not result.ok:
+                    raise UploadError(result.error, result.category, result.http_code)
+                job.sent_size = size
+            job.state = "verifying"
+            listing = client.list_files(job.remote_path)
+            if listing is None:
+                # The file went through; the next attempt only repeats the check
+                failure = client.last_listing_error
+                raise UploadError(f"could not list {job.remote_path} to verify the upload ({failure})",
+                                  failure.category, failure.http_code)
+            remote = {f.get("name"): f.get("size") for f in listing}
+            if job.name not in remote or not sizes_match(size, remote[job.name]):
+                job.sent_size = None
+                raise UploadError(f"remote size {remote.get(job.name)!r} does not match {size}", "size_mismatch")
+            job.uploaded_size = size
+        except Exception as e:
+            job.category = classify_error(e)
+            job.last_error = str(e)
+            http_code = getattr(e, "http_code", None)
+            # 4xx means the laser rejected the request itself; sending it again won't help
+            retryable = job.category in self.RETRYABLE and not (http_code and 400 <= http_code < 500)
+            if retryable and job.attempts < self.max_attempts:
+                job.state = "pending"
+                delay = self.backoff(job.attempts)
+                job.next_try = time.time() + delay
+                upload_log.warning(f"Upload of {job.name} failed ({job.category}: {e}); "
+                                   f"retry {job.attempts}/{self.max_attempts - 1} in {delay:.1f}s")
+                self.save()
+                self.notify("retry", job)
+            else:
+                job.state = "failed"
+                upload_log.error(f"Upload of {job.name} failed permanently ({job.category}): {e}")
+                self._remove(job)
+                self.notify("failed", job)
+            return
+        job.state = "done"
+        # Earlier failed attempts don't describe a job that went through
+        job.category = job.last_error = None
+        self._remove(job)
+        self.notify("done", job)
+
+    def _remove(self, job):
+        with self.lock:
+            self.jobs = [j for j in self.jobs if j.id != job.id]
+        self.save()
+
+def format_duration(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+class KeepaliveWorker(threading.Thread):
+    """Background [ESP400] prober that never touches Tk.
+
+    Results are put on `results` as ("keepalive", ok, latency) tuples. The probe
+    interval grows by `backoff` while the laser answers and drops back to
+    `min_interval` as soon as a probe fails.
+    """
+
+    def __init__(self, get_client, is_active, results, min_interval=2.0, max_interval=10.0, backoff=1.5):
+        super().__init__(daemon=True)
+        self.get_client = get_client
+        self.is_active = is_active
+        self.results = results
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self.failures = 0
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def wake(self):
+        # Probe right away and restart from the fast interval (e.g. after connecting)
+        self.interval = self.min_interval
+        self._wake_event.set()
+
+    def probe(self):
+        start = time.perf_counter()
+        try:
+            ok = self.get_client().send_command("[ESP400]", logger=keepalive_log).ok
+        except Exception as e:
+            keepalive_log.debug(f"Keepalive exception: {e}")
+            ok = False
+        return ok, time.perf_counter() - start
+
+    def run(self):
+        while not self._stop_event.is_set():
+            if self.is_active():
+                ok, latency = self.probe()
+                if self._stop_event.is_set():
+                    return
+                if ok:
+                    if self.failures:
+                        keepalive_log.info(f"Link restored after {self.failures} failed check(s)")
+                    self.failures = 0
+                    self.interval = min(self.interval * self.backoff, self.max_interval)
+                else:
+                    self.failures += 1
+                    keepalive_log.warning("Keepalive check failed")
+                    self.interval = self.min_interval
+                self.results.put(("keepalive", ok, latency))
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
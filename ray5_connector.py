@@ -1,25 +1,32 @@
-import requests
-import json
+import asyncio
+import fnmatch
 import socket
 import time
 import re
 import os
 import sys
 import threading
+import queue
+import itertools
 import logging
-import urllib.parse
+import posixpath
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("connector.log", encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+import ray5_client
+from ray5_client import (KeepaliveWorker, ListingCache, UploadManifest, UploadQueue, client_from_config,
+                         format_duration, format_esp_size, is_dir, join_remote)
+from ray5_async import AsyncLoopThread, async_client_from_config, broadcast_upload
+from ray5_analyze import HAS_NUMPY, AnalysisCache, analyze_chunks
+from ray5_discovery import find_laser, parse_sta_mac
+from ray5_gcode import GCODE_PATTERNS, machine_from_config, minifier_from_config
+from ray5_metrics import METRICS, MetricsServer
+from ray5_raster import HAS_PIL, IMAGE_PATTERNS, MODES, gcode_name, raster_settings, shared_engraver
+from ray5_validate import validate_chunks, validate_file, validation_from_config
+from ray5_logging import setup_logging
+from ray5_watch import DEFAULT_PATTERNS, FolderSync, SyncEventLog
+
+log = logging.getLogger("ray5.gui")
 
 try:
     from tkinterdnd2 import DND_FILES, TkinterDnD
@@ -35,116 +42,487 @@ if sys.platform == "win32":
     except:
         pass
 
-class Ray5Client:
-    def __init__(self, ip="192.168.1.101", port=8848):
-        self.ip = ip
-        self.port = port
-        self.base_url = f"http://{ip}:{port}"
-        self.mac = None
+class HighlightAnimator:
+    """Fades highlighted Treeview rows from light green to white on a single timer.
 
-    def get_files(self, path="/"):
-        try:
-            encoded_path = urllib.parse.quote(path)
-            r = requests.get(f"{self.base_url}/files?path={encoded_path}", timeout=5)
-            if r.status_code == 200:
-                data = json.loads(r.content.decode('utf-8', errors='ignore'))
-                return data.get("files", [])
-            logging.error(f"Failed to get files: HTTP {r.status_code}")
-            return []
-        except Exception as e:
-            logging.error(f"Error getting files: {e}")
-            return []
-
-    def upload_file(self, local_path, remote_path="/"):
-        filename = os.path.basename(local_path)
-        filesize = os.path.getsize(local_path)
-        encoded_path = urllib.parse.quote(remote_path)
-        url = f"{self.base_url}/upload?path={encoded_path}"
+    The palette is a fixed set of `steps` tags configured once; each tick moves
+    every highlighted row one tag along, grouped so a whole batch of rows that
+    were highlighted together costs one Tk call per tick.
+    """
+
+    def __init__(self, root, tree, steps=15, interval=1000, start=(144, 238, 144), end=(255, 255, 255)):
+        self.root = root
+        self.tree = tree
+        self.steps = steps
+        self.interval = interval
+        self.tags = []
+        for step in range(steps):
+            t = step / steps
+            r, g, b = (int(a + (z - a) * t) for a, z in zip(start, end))
+            tag = f"fade_{step}"
+            self.tree.tag_configure(tag, background=f"#{r:02x}{g:02x}{b:02x}")
+            self.tags.append(tag)
+        self.items = {}
+        self.job = None
+
+    def _tag(self, action, tag, items):
+        # ttk.Treeview has no wrapper for "tag add/remove" (Tk 8.6), which take many items at once
+        if items:
+            self.tree.tk.call(self.tree, "tag", action, tag, items)
+
+    def highlight(self, item_ids):
+        fresh = [i for i in item_ids if self.tree.exists(i)]
+        for item_id in fresh:
+            old = self.items.get(item_id)
+            if old is not None:
+                self._tag("remove", self.tags[old], [item_id])
+            self.items[item_id] = 0
+        self._tag("add", self.tags[0], fresh)
+        if self.items and self.job is None:
+            self.job = self.root.after(self.interval, self._tick)
+
+    def forget(self, item_ids):
+        for item_id in item_ids:
+            self.items.pop(item_id, None)
+
+    def clear(self):
+        for item_id, step in self.items.items():
+            if self.tree.exists(item_id):
+                self._tag("remove", self.tags[step], [item_id])
+        self.items = {}
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self.job = None
+
+    def _tick(self):
+        self.job = None
+        groups = {}
+        for item_id, step in list(self.items.items()):
+            if not self.tree.exists(item_id):
+                del self.items[item_id]
+                continue
+            groups.setdefault(step, []).append(item_id)
+        for step, item_ids in groups.items():
+            self._tag("remove", self.tags[step], item_ids)
+            if step + 1 < self.steps:
+                self._tag("add", self.tags[step + 1], item_ids)
+                for item_id in item_ids:
+                    self.items[item_id] = step + 1
+            else:
+                self.forget(item_ids)
+        if self.items:
+            self.job = self.root.after(self.interval, self._tick)
+
+class TaskRunner:
+    """Shared background executor with one ordered lane per operation kind.
+
+    Tasks of the same kind ("connect", "upload", "delete", "analyze") run one at a
+    time in submission order. Each task gets a sequence number which is passed
+    with its result to `on_result(seq, result)`, run via `post` on the UI thread.
+    Listings don't come through here: Ray5Client.cached_files revalidates them on
+    its own thread and ListingCache versions keep stale ones out.
+    """
+
+    def __init__(self, post):
+        self.post = post
+        self.loop_thread = None
+        self.lanes = {}
+        self.seq = itertools.count(1)
+        self.lock = threading.Lock()
+        self.running = True
+
+    def submit(self, kind, fn, on_result=None):
+        with self.lock:
+            seq = next(self.seq)
+            lane = self.lanes.get(kind)
+            if lane is None:
+                lane = self.lanes[kind] = queue.Queue()
+                threading.Thread(target=self._run_lane, args=(kind, lane), daemon=True).start()
+            lane.put((seq, fn, on_result))
+        return seq
+
+    def submit_async(self, coro, on_result=None):
+        """Run a coroutine on the shared asyncio loop (e.g. AsyncRay5Client calls for many lasers).
+
+        Returns a concurrent.futures.Future; cancelling it cancels the coroutine.
+        """
+        with self.lock:
+            if self.loop_thread is None:
+                self.loop_thread = AsyncLoopThread()
+        future = self.loop_thread.submit(coro)
+        if on_result is not None:
+            def done(f):
+                if f.cancelled() or not self.running:
+                    return
+                if f.exception() is not None:
+                    log.error(f"Background async task failed: {f.exception()}")
+                    return
+                self.post(lambda: on_result(f.result()))
+            future.add_done_callback(done)
+        return future
+
+    def shutdown(self):
+        with self.lock:
+            self.running = False
+            for lane in self.lanes.values():
+                lane.put(None)
+            if self.loop_thread is not None:
+                self.loop_thread.stop()
+
+    def _run_lane(self, kind, lane):
+        while True:
+            item = lane.get()
+            if item is None or not self.running:
+                return
+            seq, fn, on_result = item
+            try:
+                result = fn()
+            except Exception as e:
+                log.error(f"Background {kind} task failed: {e}")
+                continue
+            if on_result is not None and self.running:
+                self.post(lambda cb=on_result, seq=seq, result=result: cb(seq, result))
+
+class FleetWindow:
+    """Dashboard for several lasers, all polled by one coroutine on the shared asyncio loop.
+
+    Rows show a keepalive dot, firmware from [ESP420], SD usage from /files and the
+    latency of the last poll. "Broadcast Upload" sends one file to every selected
+    laser, reading it from disk once.
+    """
+
+    COLUMNS = (("name", "Name", 120), ("ip", "IP", 110), ("state", "", 30), ("firmware", "Firmware", 110),
+               ("sd", "SD usage", 170), ("latency", "Latency", 70), ("seen", "Last seen", 80),
+               ("transfer", "Transfer", 120))
+
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.last_config.get("fleet_poll_interval", 5.0)
+        self.devices = list(app.last_config.get("fleet", []))
+        self.ips = [d["ip"] for d in self.devices]
+        self.clients = {}
+        self.rows = {}
+        self.last_progress = {}
         
+        self.window = tk.Toplevel(app.root)
+        self.window.title("Ray5 Fleet")
+        self.window.geometry("920x360")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        
+        self.tree = ttk.Treeview(self.window, columns=[c[0] for c in self.COLUMNS], show="headings",
+                                 selectmode="extended")
+        for key, title, width in self.COLUMNS:
+            self.tree.heading(key, text=title)
+            self.tree.column(key, width=width, stretch=key in ("name", "sd"))
+        self.tree.tag_configure("online", foreground="#008800")
+        self.tree.tag_configure("offline", foreground="gray")
+        self.tree.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        bar = ttk.Frame(self.window)
+        bar.pack(fill="x", padx=10, pady=5)
+        self.new_ip = tk.StringVar()
+        ttk.Entry(bar, textvariable=self.new_ip, width=16).pack(side="left", padx=5)
+        ttk.Button(bar, text="Add Laser", command=self.add_device).pack(side="left", padx=5)
+        ttk.Button(bar, text="Remove Selected", command=self.remove_selected).pack(side="left", padx=5)
+        ttk.Button(bar, text="Broadcast Upload...", command=self.broadcast).pack(side="left", padx=5)
+        
+        for device in self.devices:
+            self.add_row(device)
+        self.poller = app.runner.submit_async(self.poll_forever())
+
+    def add_row(self, device):
+        ip = device["ip"]
+        self.rows[ip] = self.tree.insert("", "end", values=(device.get("name", ip), ip, "\u25cf", "", "", "", "", ""),
+                                         tags=("offline",))
+
+    def save_devices(self):
+        self.ips = [d["ip"] for d in self.devices]
+        self.app.last_config["fleet"] = self.devices
+        self.app.write_config()
+
+    def add_device(self):
+        ip = self.new_ip.get().strip()
+        if not self.app.is_valid_ip(ip) or ip in self.rows:
+            return
+        device = {"ip": ip, "name": ip}
+        self.devices.append(device)
+        self.add_row(device)
+        self.save_devices()
+        self.new_ip.set("")
+
+    def remove_selected(self):
+        selected = set(self.tree.selection())
+        for ip, item_id in list(self.rows.items()):
+            if item_id in selected:
+                self.tree.delete(item_id)
+                del self.rows[ip]
+        self.devices = [d for d in self.devices if d["ip"] in self.rows]
+        self.save_devices()
+
+    # --- runs on the asyncio loop ----------------------------------------
+
+    def client(self, ip):
+        client = self.clients.get(ip)
+        if client is None:
+            client = self.clients[ip] = async_client_from_config(self.app.last_config, ip)
+        return client
+
+    async def poll_one(self, ip):
+        client = self.client(ip)
+        res = await client.send_command("[ESP420]", timeout=3)
+        info = res.text if res.ok else ""
+        latency = res.elapsed
+        if "FW version" not in info:
+            return {"ip": ip, "online": False}
+        firmware = re.search(r"FW version:\s*(.+)", info)
+        listing = await client.get_listing("/", timeout=3)
+        return {
+            "ip": ip,
+            "online": True,
+            "latency": latency,
+            "firmware": firmware.group(1).strip() if firmware else "?",
+            "mac": parse_sta_mac(info),
+            "sd": listing,
+            "seen": time.time(),
+        }
+
+    async def poll_forever(self):
+        while True:
+            ips = self.ips
+            results = await asyncio.gather(*(self.poll_one(ip) for ip in ips))
+            self.app.post(lambda r=results: self.show_status(r))
+            await asyncio.sleep(self.interval)
+
+    async def close_clients(self):
+        for client in self.clients.values():
+            await client.close()
+
+    async def broadcast_to(self, ips, path):
+        def progress(ip, p):
+            # Called for every block; only post a few updates per second per laser
+            now = time.perf_counter()
+            if now - self.last_progress.get(ip, 0) >= 0.25 or p.sent >= p.total:
+                self.last_progress[ip] = now
+                self.app.post(lambda: self.set_cell(ip, "transfer", f"{p.fraction:.0%} {p.rate / 1e6:.2f} MB/s"))
+        return await broadcast_upload([self.client(ip) for ip in ips], path, progress=progress)
+
+    # --- UI thread -------------------------------------------------------
+
+    def set_cell(self, ip, column, value):
+        item_id = self.rows.get(ip)
+        if item_id is not None and self.tree.exists(item_id):
+            self.tree.set(item_id, column, value)
+
+    def show_status(self, results):
+        if not self.window.winfo_exists():
+            return
+        for r in results:
+            item_id = self.rows.get(r["ip"])
+            if item_id is None:
+                continue
+            self.tree.item(item_id, tags=("online" if r["online"] else "offline",))
+            if not r["online"]:
+                continue
+            sd = r["sd"] or {}
+            used, total = sd.get("used", "?"), sd.get("total", "?")
+            if str(used).isdigit() and str(total).isdigit():
+                used, total = format_esp_size(int(used)), format_esp_size(int(total))
+            self.tree.set(item_id, "firmware", r["firmware"])
+            self.tree.set(item_id, "sd", f"{sd.get('occupation', '?')}% ({used} / {total})" if sd else "")
+            self.tree.set(item_id, "latency", f"{r['latency'] * 1000:.0f} ms")
+            self.tree.set(item_id, "seen", time.strftime("%H:%M:%S", time.localtime(r["seen"])))
+
+    def broadcast(self):
+        ips = [ip for ip, item_id in self.rows.items() if item_id in self.tree.selection()]
+        if not ips:
+            return
+        path = filedialog.askopenfilename(parent=self.window)
+        if not path:
+            return
+        for ip in ips:
+            self.set_cell(ip, "transfer", "queued")
+        log.info(f"Broadcasting {os.path.basename(path)} to {len(ips)} laser(s)")
+        
+        def done(results):
+            for ip, res in results.items():
+                self.set_cell(ip, "transfer", "done" if res.ok else "failed")
+                if not res.ok:
+                    log.error(f"Broadcast to {ip} failed: {res}")
+        self.app.runner.submit_async(self.broadcast_to(ips, path), done)
+
+    def close(self):
+        self.poller.cancel()
+        self.app.runner.submit_async(self.close_clients())
+        self.window.destroy()
+        self.app.fleet_window = None
+
+
+class EngraveDialog:
+    """Raster settings for one image; the G-code is rendered while it uploads.
+
+    Settings are remembered in the config "raster" section.
+    """
+
+    FIELDS = (("width", "Width (mm)", float), ("interval", "Line interval (mm)", float),
+              ("power", "Power (S)", int), ("min_power", "Min power (S)", int), ("feed", "Feed (mm/min)", float))
+
+    def __init__(self, app, image=""):
+        self.app = app
+        settings = raster_settings(app.last_config)
+        self.window = tk.Toplevel(app.root)
+        self.window.title("Engrave Image")
+        self.window.transient(app.root)
+        frame = ttk.Frame(self.window, padding=10)
+        frame.pack(fill="both", expand=True)
+
+        self.image = tk.StringVar(value=image)
+        ttk.Label(frame, text="Image").grid(row=0, column=0, sticky="w", pady=2)
+        ttk.Entry(frame, textvariable=self.image, width=36).grid(row=0, column=1, columnspan=2, sticky="we")
+        ttk.Button(frame, text="Browse...", command=self.browse).grid(row=0, column=3, padx=5)
+
+        self.vars = {}
+        for row, (key, label, _) in enumerate(self.FIELDS, start=1):
+            ttk.Label(frame, text=label).grid(row=row, column=0, sticky="w", pady=2)
+            self.vars[key] = tk.StringVar(value=str(settings[key]))
+            ttk.Entry(frame, textvariable=self.vars[key], width=10).grid(row=row, column=1, sticky="w")
+        row = len(self.FIELDS) + 1
+        ttk.Label(frame, text="Origin X / Y (mm)").grid(row=row, column=0, sticky="w", pady=2)
+        self.origin = [tk.StringVar(value=str(v)) for v in settings["origin"]]
+        ttk.Entry(frame, textvariable=self.origin[0], width=10).grid(row=row, column=1, sticky="w")
+        ttk.Entry(frame, textvariable=self.origin[1], width=10).grid(row=row, column=2, sticky="w")
+        ttk.Label(frame, text="Mode").grid(row=row + 1, column=0, sticky="w", pady=2)
+        self.mode = tk.StringVar(value=settings["mode"])
+        ttk.Combobox(frame, textvariable=self.mode, values=MODES, state="readonly",
+                     width=10).grid(row=row + 1, column=1, sticky="w")
+        self.bidirectional = tk.BooleanVar(value=settings["bidirectional"])
+        ttk.Checkbutton(frame, text="Both directions", variable=self.bidirectional).grid(row=row + 2, column=1,
+                                                                                        sticky="w")
+        self.negative = tk.BooleanVar(value=settings["negative"])
+        ttk.Checkbutton(frame, text="Negative", variable=self.negative).grid(row=row + 2, column=2, sticky="w")
+
+        self.error = ttk.Label(frame, text="", foreground="#CC0000")
+        self.error.grid(row=row + 3, column=0, columnspan=4, sticky="w", pady=(5, 0))
+        bar = ttk.Frame(frame)
+        bar.grid(row=row + 4, column=0, columnspan=4, pady=(10, 0))
+        ttk.Button(bar, text="Engrave", command=self.engrave).pack(side="left", padx=5)
+        ttk.Button(bar, text="Cancel", command=self.window.destroy).pack(side="left", padx=5)
+
+    def browse(self):
+        types = [("Images", " ".join(IMAGE_PATTERNS)), ("All files", "*")]
+        path = filedialog.askopenfilename(parent=self.window, filetypes=types)
+        if path:
+            self.image.set(path)
+
+    def engrave(self):
+        image = self.image.get().strip()
+        if not os.path.isfile(image):
+            self.error.config(text="Choose an image file")
+            return
         try:
-            with open(local_path, "rb") as f:
-                data = {
-                    'path': remote_path,
-                    'size': str(filesize)
-                }
-                files = {'file': (filename, f, 'application/octet-stream')}
-                r = requests.post(url, data=data, files=files, timeout=60)
-                if r.status_code == 200:
-                    logging.info(f"Uploaded {filename} successfully")
-                    return "Upload successful"
-                logging.error(f"Upload failed: {r.status_code} {r.text}")
-                return f"Upload failed: {r.status_code}"
-        except Exception as e:
-            logging.error(f"Upload error for {filename}: {e}")
-            return f"Upload error: {e}"
-
-    def delete_file(self, filename, path="/"):
-        try:
-            # Manufacturer uses /command?commandText=$SD/Delete=filename
-            encoded_filename = urllib.parse.quote(filename)
-            url = f"{self.base_url}/command?commandText=$SD/Delete={encoded_filename}"
-            r = requests.get(url, timeout=5)
-            if r.status_code == 200:
-                logging.info(f"Deleted {filename} successfully")
-                return "Delete command sent"
-            logging.error(f"Delete failed for {filename}: HTTP {r.status_code}")
-            return f"Delete failed: {r.status_code}"
-        except Exception as e:
-            logging.error(f"Delete error for {filename}: {e}")
-            return f"Delete error: {e}"
-
-    def send_command(self, cmd):
-        try:
-            encoded_cmd = urllib.parse.quote(cmd)
-            r = requests.get(f"{self.base_url}/command?plain={encoded_cmd}", timeout=5)
-            return r.text
-        except Exception as e:
-            logging.error(f"Command error ({cmd}): {e}")
-            return f"Command error: {e}"
+            values = {key: cast(self.vars[key].get()) for key, _, cast in self.FIELDS}
+            values["origin"] = [float(v.get()) for v in self.origin]
+        except ValueError as e:
+            self.error.config(text=f"Invalid number: {e}")
+            return
+        if values["width"] <= 0 or values["interval"] <= 0:
+            self.error.config(text="Width and line interval must be positive")
+            return
+        values.update(mode=self.mode.get(), bidirectional=self.bidirectional.get(), negative=self.negative.get())
+        self.app.last_config.setdefault("raster", {}).update(values)
+        self.app.write_config()
+        self.window.destroy()
+        self.app.perform_upload([image], render=raster_settings(self.app.last_config))
+
+def format_distance(mm):
+    return f"{mm / 1000:.1f} m" if mm >= 1000 else f"{mm:.0f} mm"
 
 class Ray5App:
+    # Upload queue panel; the analysis columns stay empty without numpy
+    QUEUE_COLUMNS = (("state", "Status", 80), ("size", "Size", 80), ("bounds", "Burn area (mm)", 150),
+                     ("burn", "Burn", 70), ("travel", "Travel", 70), ("time", "Est. time", 70),
+                     ("on", "Laser on", 60))
+
     def __init__(self, root):
         self.root = root
         self.root.title("Longer Ray5 Connector")
-        self.root.geometry("800x600")
+        self.root.geometry("860x720")
         
         # Handle window closing
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         self.running = True
         
-        self.client = Ray5Client()
         self.last_config = self.load_config()
+        # Listing cache shared by successive clients for the same laser
+        self.listings = ListingCache(self.last_config.get("listing_ttl", 30.0))
+        self.listings_device = None
+        self.client = self.make_client()
         self.connected = False
         self.current_mac = "Unknown"
+        self.known_mac = self.last_config.get("last_mac")
+        if self.known_mac == "Unknown":
+            self.known_mac = None
+        self.ui_queue = queue.Queue()
+        self.runner = TaskRunner(self.post)
+        self.manifest = UploadManifest()
+        # SD paths ("/jobs/a.gcode") <-> Treeview items; folders get children once expanded
+        self.rows = {}
+        self.paths = {}
+        self.folders = set()
+        self.loaded_dirs = set()
+        self.placeholders = {}
+        self.fleet_window = None
+        self.metrics_server = None
+        self.watcher = None
+        # Watch batches that arrived while disconnected, planned once connected: path -> first seen
+        self.watch_held = {}
+        self.watch_lock = threading.Lock()
+        # job id -> Treeview item in the upload queue panel
+        self.queue_rows = {}
+        self.analyses = AnalysisCache(machine_from_config(self.last_config)) if HAS_NUMPY else None
+        # (machine, rules) for the pre-upload G-code check, None when it is off
+        self.validation = validation_from_config(self.last_config)
+        self.sync_log = SyncEventLog(ray5_client.config_file("sync_events.jsonl"))
         
         self.setup_ui()
         
-        # Auto-connect if last IP exists
+        # Auto-connect if last IP exists, falling back to a MAC scan
         if self.last_config.get("last_ip"):
             self.ip_var.set(self.last_config["last_ip"])
+        if self.last_config.get("last_ip") or self.known_mac:
             self.connect()
         
         self.start_keepalive()
+        self.start_upload_queue()
+        self.start_metrics_server()
+        if self.watch_var.get():
+            self.start_watch()
+        self.pump_ui_queue()
+        self.refresh_stats()
 
     def on_closing(self):
         self.running = False
+        self.keepalive.stop()
+        self.uploads.stop()
+        self.stop_watch()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        self.runner.shutdown()
+        self.client.close()
         self.root.destroy()
 
+    def make_client(self, ip="192.168.1.101"):
+        return client_from_config(self.last_config, ip, listings=self.listings)
+
     def load_config(self):
-        if os.path.exists("config.json"):
-            try:
-                with open("config.json", "r") as f:
-                    return json.load(f)
-            except Exception as e:
-                logging.error(f"Failed to load config: {e}")
-        return {}
+        return ray5_client.load_config()
 
     def save_config(self, mac, ip):
-        try:
-            with open("config.json", "w") as f:
-                json.dump({"last_mac": mac, "last_ip": ip}, f)
-        except Exception as e:
-            logging.error(f"Failed to save config: {e}")
+        # Keep any other settings (pool size, timeouts) stored alongside
+        self.last_config.update({"last_mac": mac, "last_ip": ip})
+        self.write_config()
+
+    def write_config(self):
+        ray5_client.save_config(self.last_config)
 
     def setup_ui(self):
         # Top Bar: Connection
@@ -159,6 +537,8 @@ class Ray5App:
         self.btn_connect = ttk.Button(conn_frame, text="Connect / Scan", command=self.toggle_connect)
         self.btn_connect.pack(side="left", padx=5)
         
+        ttk.Button(conn_frame, text="Fleet...", command=self.open_fleet).pack(side="left", padx=5)
+        
         # Status and Keepalive Dot
         status_frame = ttk.Frame(conn_frame)
         status_frame.pack(side="right", padx=10)
@@ -174,34 +554,80 @@ class Ray5App:
         list_frame = ttk.LabelFrame(self.root, text="Files on Laser")
         list_frame.pack(fill="both", expand=True, padx=10, pady=5)
         
-        self.tree = ttk.Treeview(list_frame, columns=("name", "size"), show="headings", selectmode="extended")
-        self.tree.heading("name", text="Filename")
+        self.tree = ttk.Treeview(list_frame, columns=("size",), show="tree headings", selectmode="extended")
+        self.tree.heading("#0", text="Filename")
         self.tree.heading("size", text="Size")
+        self.tree.column("size", width=120, stretch=False)
+        self.tree.bind("<<TreeviewOpen>>", self.on_tree_open)
         self.tree.pack(fill="both", expand=True, side="left")
         
-        # Define tag for fading effect
-        self.tree.tag_configure("new_file", background="#90EE90")
+        # Shared palette of fade tags for new files
+        self.highlighter = HighlightAnimator(self.root, self.tree)
+        # Batch delete markers: waiting for the laser, and rolled back after a failure
+        self.tree.tag_configure("deleting", foreground="gray")
+        self.tree.tag_configure("delete_failed", background="#FFC8C8")
         
         scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.tree.yview)
         scrollbar.pack(side="right", fill="y")
         self.tree.configure(yscrollcommand=scrollbar.set)
 
+        # Local files waiting for upload, with a job estimate for G-code
+        queue_frame = ttk.LabelFrame(self.root, text="Upload Queue")
+        queue_frame.pack(fill="x", padx=10, pady=(0, 5))
+        self.queue_tree = ttk.Treeview(queue_frame, columns=[c[0] for c in self.QUEUE_COLUMNS],
+                                       show="tree headings", height=4, selectmode="browse")
+        self.queue_tree.heading("#0", text="Local file")
+        self.queue_tree.column("#0", width=160)
+        for key, title, width in self.QUEUE_COLUMNS:
+            self.queue_tree.heading(key, text=title)
+            self.queue_tree.column(key, width=width, stretch=False)
+        self.queue_tree.tag_configure("failed", background="#FFC8C8")
+        self.queue_tree.pack(fill="x", expand=True, side="left")
+
+        # Link statistics for the connected laser
+        stats_frame = ttk.LabelFrame(self.root, text="Link")
+        stats_frame.pack(fill="x", padx=10, pady=(0, 5))
+        self.stats_label = ttk.Label(stats_frame, text="No requests yet", font="TkFixedFont")
+        self.stats_label.pack(side="left", padx=5)
+
         # Bottom Bar: Actions
         action_frame = ttk.Frame(self.root)
         action_frame.pack(fill="x", padx=10, pady=5)
         
-        ttk.Button(action_frame, text="Refresh List", command=self.refresh_list).pack(side="left", padx=5)
+        ttk.Button(action_frame, text="Refresh List", command=lambda: self.refresh_list(force=True)).pack(side="left", padx=5)
         ttk.Button(action_frame, text="Upload File(s)", command=self.upload).pack(side="left", padx=5)
+        # Loading images needs Pillow; without it the button stays greyed out
+        ttk.Button(action_frame, text="Engrave Image...", command=self.engrave_image,
+                   state="normal" if HAS_PIL and HAS_NUMPY else "disabled").pack(side="left", padx=5)
         ttk.Button(action_frame, text="Delete Selected", command=self.delete).pack(side="left", padx=5)
+        
+        self.sync_var = tk.BooleanVar(value=self.last_config.get("sync_mode", False))
+        ttk.Checkbutton(action_frame, text="Skip unchanged", variable=self.sync_var,
+                        command=self.toggle_sync_mode).pack(side="left", padx=5)
+        
+        self.minify_var = tk.BooleanVar(value=bool(self.last_config.get("minify", {}).get("enabled")))
+        ttk.Checkbutton(action_frame, text="Minify G-code", variable=self.minify_var,
+                        command=self.toggle_minify).pack(side="left", padx=5)
+        
+        watch = self.last_config.get("watch", {})
+        self.watch_var = tk.BooleanVar(value=bool(watch.get("enabled") and watch.get("folder")))
+        ttk.Checkbutton(action_frame, text="Watch folder", variable=self.watch_var,
+                        command=self.toggle_watch).pack(side="left", padx=5)
 
         # Drag and Drop setup
         if HAS_DND:
             self.root.drop_target_register(DND_FILES)
             self.root.dnd_bind('<<Drop>>', self.handle_drop)
 
+    def open_fleet(self):
+        if self.fleet_window is not None:
+            self.fleet_window.window.lift()
+            return
+        self.fleet_window = FleetWindow(self)
+
     def handle_drop(self, event):
         if not self.connected:
-            logging.warning("Drop ignored: Not connected")
+            log.warning("Drop ignored: Not connected")
             return
             
         data = event.data
@@ -216,7 +642,11 @@ class Ray5App:
         else:
             paths = data.split()
             
-        if paths:
+        # A dropped picture opens the engraving settings instead of uploading as is
+        images = [p for p in paths if any(fnmatch.fnmatch(p.lower(), pat) for pat in IMAGE_PATTERNS)]
+        if len(images) == 1 and len(paths) == 1 and HAS_PIL and HAS_NUMPY:
+            self.engrave_image(images[0])
+        elif paths:
             self.perform_upload(paths)
 
     def toggle_connect(self):
@@ -231,9 +661,8 @@ class Ray5App:
         self.btn_connect.config(text="Connect / Scan")
         self.status_label.config(text="Disconnected")
         self.dot_canvas.itemconfig(self.dot, fill="gray")
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-        logging.info("Disconnected from laser")
+        self.clear_tree()
+        log.info("Disconnected from laser")
 
     def is_valid_ip(self, ip):
         try:
@@ -245,39 +674,88 @@ class Ray5App:
     def connect(self):
         ip = self.ip_var.get().strip()
         if not self.is_valid_ip(ip):
-            logging.error(f"Invalid IP address: {ip}")
-            self.status_label.config(text="Invalid IP")
-            return
+            if not self.known_mac:
+                log.error(f"Invalid IP address: {ip}")
+                self.status_label.config(text="Invalid IP")
+                return
+            ip = None
 
-        self.status_label.config(text="Connecting...")
-        logging.info(f"Attempting to connect to {ip}...")
+        self.status_label.config(text="Connecting..." if ip else "Scanning...")
+        log.info(f"Attempting to connect to {ip or 'laser ' + self.known_mac}...")
         
+        def set_status(text):
+            self.ui_queue.put(("status", text))
+
         def task():
-            client = Ray5Client(ip)
-            info = client.send_command("[ESP420]")
-            if not self.running: return
+            nonlocal ip
+            info = ""
+            if ip:
+                client = self.make_client(ip)
+                res = client.send_command("[ESP420]")
+                info = res.text if res.ok else ""
+                if not self.running:
+                    client.close()
+                    return
+                if "FW version" not in info:
+                    log.error(f"Could not connect to laser at {ip}. Response: {res}")
+                    client.close()
+
+            if "FW version" not in info and self.known_mac:
+                # Known IP failed; the laser may have a new DHCP lease
+                set_status("Scanning network...")
+                scan = self.last_config.get("scan", {})
+                found = find_laser(
+                    self.known_mac,
+                    cidr=scan.get("cidr"),
+                    hint_ip=ip or self.last_config.get("last_ip"),
+                    concurrency=scan.get("concurrency", 64),
+                    timeout=scan.get("timeout", 1.5),
+                )
+                if not self.running: return
+                if found:
+                    ip, info = found
+                    client = self.make_client(ip)
+                    self.post(lambda: self.ip_var.set(ip))
+
             if "FW version" in info:
-                mac_match = re.search(r"STA \(([0-9A-F:]+)\)", info)
-                mac = mac_match.group(1) if mac_match else "Unknown"
-                self.client = client
+                mac = parse_sta_mac(info) or "Unknown"
+                old_client, self.client = self.client, client
+                old_client.close()
                 self.current_mac = mac
+                if mac != "Unknown":
+                    self.known_mac = mac
                 self.save_config(mac, ip)
-                logging.info(f"Connected to {ip} (MAC: {mac})")
-                if self.running:
-                    self.root.after(0, lambda: self.on_connected(ip, mac) if self.running else None)
+                log.info(f"Connected to {ip} (MAC: {mac})")
+                self.post(lambda: self.on_connected(ip, mac))
             else:
-                logging.error(f"Could not connect to laser at {ip}. Response: {info}")
-                if self.running:
-                    self.root.after(0, lambda: self.status_label.config(text="Connection Failed") if self.running else None)
+                set_status("Connection Failed")
         
-        threading.Thread(target=task, daemon=True).start()
+        self.runner.submit("connect", task)
 
     def on_connected(self, ip, mac):
         self.connected = True
         self.ip_entry.config(state="disabled")
         self.btn_connect.config(text="Disconnect")
         self.update_status_text()
-        self.refresh_list()
+        self.keepalive.wake()
+        self.uploads.wake()
+        with self.watch_lock:
+            held, self.watch_held = self.watch_held, {}
+        if held:
+            self.runner.submit("upload", lambda: self.on_watch_ready(
+                [(path, seen) for path, seen in held.items() if os.path.isfile(path)]))
+        device = mac if mac != "Unknown" else ip
+        if device != self.listings_device:
+            # Different laser: start from an empty cache the old client can't write into
+            self.listings = self.client.listings = ListingCache(self.listings.ttl)
+            self.listings_device = device
+        self.clear_tree()
+        # Paints the last known listing immediately and revalidates it in the background
+        self.refresh_list(force=True)
+
+    def current_device(self):
+        # Key of the connected laser in the manifest and upload queue: its MAC, else its IP
+        return self.current_mac if self.current_mac != "Unknown" else self.client.ip
 
     def update_status_text(self):
         if self.connected:
@@ -286,23 +764,195 @@ class Ray5App:
             self.status_label.config(text="Disconnected")
 
     def start_keepalive(self):
-        def check():
-            if not self.running: return
-            if self.connected:
+        settings = self.last_config.get("keepalive", {})
+        self.keepalive = KeepaliveWorker(
+            lambda: self.client,
+            lambda: self.connected and self.running,
+            self.ui_queue,
+            min_interval=settings.get("min_interval", 2.0),
+            max_interval=settings.get("max_interval", 10.0),
+            backoff=settings.get("backoff", 1.5),
+        )
+        self.keepalive.start()
+
+    def start_upload_queue(self):
+        settings = self.last_config.get("upload_retry", {})
+        self.upload_progress_posted = 0.0
+        # Bytes uploaded since the queue was last empty, for the overall percentage
+        self.upload_batch_done = 0
+        self.uploads = UploadQueue(
+            lambda: self.client,
+            lambda: self.connected and self.running,
+            path=ray5_client.config_file("upload_queue.json"),
+            max_attempts=settings.get("max_attempts", 6),
+            backoff_base=settings.get("backoff_base", 2.0),
+            backoff_cap=settings.get("backoff_cap", 60.0),
+            notify=self.on_upload_event,
+            progress=self.on_upload_progress,
+            get_device=self.current_device,
+        )
+        # Jobs restored from the last session
+        for job in self.uploads.pending():
+            self.show_queue_event("queued", job)
+        self.uploads.start()
+
+    def on_upload_event(self, event, job):
+        # Called on the upload queue's worker thread
+        self.post(lambda: self.show_queue_event(event, job))
+        remaining = len(self.uploads.pending())
+        if event == "done":
+            self.upload_batch_done += job.uploaded_size or 0
+        if event in ("done", "failed") and not remaining:
+            self.upload_batch_done = 0
+        if event == "done":
+            self.sync_log.finished(job.local_path, remote_path=job.remote_path, attempts=job.attempts)
+            # Rendered jobs depend on their settings too, so never count as unchanged
+            if job.render is None:
+                self.manifest.record(job.device, job.local_path, job.remote_path, job.uploaded_size)
+                self.manifest.save()
+            # The client already added the file to its cached listing
+            self.post(self.refresh_list)
+            if not remaining:
+                self.post(self.update_status_text)
+        elif event == "retry":
+            wait = max(0.0, job.next_try - time.time())
+            self.ui_queue.put(("status", f"{job.name}: {job.category}, retrying in {format_duration(wait)} "
+                                         f"(attempt {job.attempts}, {remaining} queued)"))
+        elif event == "failed":
+            self.sync_log.finished(job.local_path, "failed", category=job.category, error=job.last_error)
+            self.ui_queue.put(("status", f"Upload of {job.name} failed: {job.category} ({job.last_error})"))
+
+    def on_upload_progress(self, job, progress):
+        # Chunks arrive far faster than the UI needs; post a few updates per second
+        now = time.perf_counter()
+        if now - self.upload_progress_posted < 0.25 and progress.sent < progress.total:
+            return
+        self.upload_progress_posted = now
+        others = [j for j in self.uploads.pending() if j.id != job.id]
+        queued_bytes = 0
+        for other in others:
+            try:
+                queued_bytes += os.path.getsize(other.local_path)
+            except OSError:
+                pass
+        done = self.upload_batch_done + progress.sent
+        overall = done / max(1, self.upload_batch_done + progress.total + queued_bytes)
+        retry = f", attempt {job.attempts}" if job.attempts > 1 else ""
+        self.post(lambda: self.set_queue_cell(job.id, "state", f"{progress.fraction:.0%}"))
+        self.ui_queue.put(("status", f"Uploading {progress.name}: {progress.fraction:.0%} "
+                                     f"at {progress.rate / 1e6:.2f} MB/s, ETA {format_duration(progress.eta)} "
+                                     f"({len(others)} queued{retry}, overall {overall:.0%})"))
+
+    def show_queue_event(self, event, job):
+        item_id = self.queue_rows.get(job.id)
+        if event == "done":
+            if item_id is not None:
+                self.queue_tree.delete(item_id)
+                del self.queue_rows[job.id]
+            return
+        if item_id is None:
+            try:
+                size = format_esp_size(os.path.getsize(job.local_path))
+            except OSError:
+                size = "missing"
+            # A failed attempt at the same file is superseded by this one
+            for old_id, old_item in list(self.queue_rows.items()):
+                if (self.queue_tree.item(old_item, "text") == job.name
+                        and "failed" in self.queue_tree.item(old_item, "tags")):
+                    self.queue_tree.delete(old_item)
+                    del self.queue_rows[old_id]
+            item_id = self.queue_tree.insert("", "end", text=job.name, values=("queued", size))
+            self.queue_rows[job.id] = item_id
+            self.analyze_job(job)
+        if event == "started":
+            self.set_queue_cell(job.id, "state", "uploading")
+        elif event == "retry":
+            self.set_queue_cell(job.id, "state", f"retry {job.attempts}")
+        elif event == "failed":
+            self.set_queue_cell(job.id, "state", "failed")
+            self.queue_tree.item(item_id, tags=("failed",))
+
+    def set_queue_cell(self, job_id, column, value):
+        item_id = self.queue_rows.get(job_id)
+        if item_id is not None:
+            self.queue_tree.set(item_id, column, value)
+
+    def analyze_job(self, job):
+        if self.analyses is None or not any(fnmatch.fnmatch(job.name.lower(), p) for p in GCODE_PATTERNS):
+            return
+        path = job.local_path
+        if job.render is not None:
+            # Estimate the raster from the same G-code the upload will render
+            machine = machine_from_config(self.last_config)
+            analyze = lambda: analyze_chunks(job.transform.chunks(path), machine)
+        else:
+            analyze = lambda: self.analyses.get(path)
+
+        def show(seq, result):
+            if job.id not in self.queue_rows:
+                return
+            if result.burn_bounds:
+                x0, y0, x1, y1 = result.burn_bounds
+                self.set_queue_cell(job.id, "bounds", f"{x1 - x0:.1f} x {y1 - y0:.1f} @ {x0:.0f},{y0:.0f}")
+            self.set_queue_cell(job.id, "burn", format_distance(result.burn))
+            self.set_queue_cell(job.id, "travel", format_distance(result.travel))
+            self.set_queue_cell(job.id, "time", format_duration(result.seconds))
+            self.set_queue_cell(job.id, "on", f"{result.laser_on_ratio:.0%}")
+
+        # Own lane so a long analysis never holds up uploads or listings
+        self.runner.submit("analyze", analyze, show)
+
+    def start_metrics_server(self):
+        # Off unless a port is configured: {"metrics": {"port": 9105}}
+        settings = self.last_config.get("metrics", {})
+        if not settings.get("port"):
+            return
+        try:
+            self.metrics_server = MetricsServer(METRICS, settings.get("host", "127.0.0.1"), settings["port"]).start()
+        except OSError as e:
+            log.error(f"Could not start metrics server on port {settings['port']}: {e}")
+
+    def refresh_stats(self):
+        if not self.running: return
+        summary = METRICS.summary(self.client.ip)
+        parts = []
+        for endpoint, s in summary.items():
+            part = f"{endpoint} {s['requests']} req p50 {s['p50'] * 1000:.0f} p95 {s['p95'] * 1000:.0f} ms"
+            if s["errors"]:
+                part += f" {s['errors']} err"
+            if endpoint == "/upload":
+                part += f" {format_esp_size(s['bytes'])}"
+            parts.append(part)
+        self.stats_label.config(text="  |  ".join(parts) if parts else "No requests yet")
+        self.root.after(2000, self.refresh_stats)
+
+    def post(self, fn):
+        # Thread-safe: run fn on the Tk thread at the next pump
+        self.ui_queue.put(("call", fn))
+
+    def pump_ui_queue(self):
+        # Single consumer for results posted by background workers
+        if not self.running: return
+        try:
+            while True:
+                msg = self.ui_queue.get_nowait()
                 try:
-                    # Simple command to check if alive
-                    res = self.client.send_command("[ESP400]")
-                    if not self.running: return
-                    if "error" not in res.lower():
-                        self.root.after(0, lambda: self.flash_dot() if self.running else None)
-                    else:
-                        logging.debug("Keepalive check failed")
+                    self.dispatch_ui_message(msg)
                 except Exception as e:
-                    logging.debug(f"Keepalive exception: {e}")
-            if self.running:
-                self.root.after(2000, check)
-        
-        threading.Thread(target=check, daemon=True).start()
+                    log.error(f"UI update failed: {e}")
+        except queue.Empty:
+            pass
+        self.root.after(100, self.pump_ui_queue)
+
+    def dispatch_ui_message(self, msg):
+        if msg[0] == "keepalive":
+            _, ok, latency = msg
+            if ok and self.connected:
+                self.flash_dot()
+        elif msg[0] == "status":
+            self.status_label.config(text=msg[1])
+        elif msg[0] == "call":
+            msg[1]()
 
     def flash_dot(self):
         if not self.running: return
@@ -323,49 +973,111 @@ class Ray5App:
         self.dot_canvas.itemconfig(self.dot, fill=color)
         self.root.after(50, lambda: self.fade_dot(step - 1) if self.running else None)
 
-    def refresh_list(self, new_filenames=None):
+    def refresh_list(self, force=False):
+        """Show the cached root and expanded folders; refetch those that are stale (all if `force`)."""
         if not self.connected or not self.running: return
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-            
-        def task():
-            files = self.client.get_files()
-            if not self.running: return
-            self.root.after(0, lambda: self.populate_tree(files, new_filenames) if self.running else None)
-            
-        threading.Thread(target=task, daemon=True).start()
+        for folder in ["/"] + sorted(self.loaded_dirs - {"/"}):
+            self.load_folder(folder, force)
+
+    def load_folder(self, folder, force=False):
+        client = self.client
+        
+        def on_update(path, files):
+            # Background revalidation finished with something new
+            self.post(lambda: self.apply_listing(path, files) if client is self.client and self.connected else None)
+        files = client.cached_files(folder, on_update, force)
+        if files is not None:
+            self.apply_listing(folder, files)
+
+    def on_tree_open(self, event):
+        path = self.paths.get(self.tree.focus())
+        if path in self.folders and path not in self.loaded_dirs:
+            self.load_folder(path)
+
+    def selected_folder(self):
+        """Folder uploads go to: the selected folder, or the folder of the selected file."""
+        for item_id in self.tree.selection():
+            path = self.paths.get(item_id)
+            if path is not None:
+                return path if path in self.folders else posixpath.dirname(path) or "/"
+        return "/"
+
+    def clear_tree(self):
+        self.highlighter.clear()
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        self.rows = {}
+        self.paths = {}
+        self.folders = set()
+        self.loaded_dirs = set()
+        self.placeholders = {}
 
-    def populate_tree(self, files, new_filenames=None):
-        for f in files:
+    def diff_listing(self, folder, files):
+        """Compare a listing of `folder` with its rows on screen.
+
+        Returns (added, removed, changed): added and changed are lists of
+        (index, path, name, size, is_dir) in listing order, removed is a list of paths.
+        """
+        parent = self.rows.get(folder, "")
+        shown = {self.paths[i] for i in self.tree.get_children(parent) if i in self.paths}
+        added, changed = [], []
+        seen = set()
+        for index, f in enumerate(files):
             name = f.get("name")
-            item_id = self.tree.insert("", "end", values=(name, f.get("size")))
-            if new_filenames and name in new_filenames:
-                self.tree.item(item_id, tags=("new_file",))
-                self.fade_item(item_id, 15)
+            if name is None: continue
+            path = join_remote(folder, name)
+            if path in seen: continue
+            seen.add(path)
+            size = f.get("size")
+            folder_entry = is_dir(f)
+            if path not in shown:
+                added.append((index, path, name, size, folder_entry))
+            elif not folder_entry and str(self.tree.set(self.rows[path], "size")) != str(size):
+                changed.append((index, path, name, size, folder_entry))
+        removed = [path for path in shown if path not in seen]
+        return added, removed, changed
 
-    def fade_item(self, item_id, seconds_left):
-        if not self.running or not self.tree.exists(item_id):
-            return
-            
-        if seconds_left <= 0:
-            self.tree.item(item_id, tags=())
-            return
-        
-        # Calculate color
-        total_steps = 15
-        step = total_steps - seconds_left
+    def apply_listing(self, folder, files):
+        if folder != "/" and folder not in self.rows: return
+        added, removed, changed = self.diff_listing(folder, files)
+        parent = self.rows.get(folder, "")
         
-        r = int(144 + (255 - 144) * (step / total_steps))
-        g = int(238 + (255 - 238) * (step / total_steps))
-        b = int(144 + (255 - 144) * (step / total_steps))
+        if removed:
+            # One Tk call for the whole batch
+            removed_ids = [self.rows[path] for path in removed]
+            for path in removed:
+                self.forget_subtree(path)
+            self.tree.delete(*removed_ids)
+        placeholder = self.placeholders.pop(folder, None)
+        if placeholder is not None:
+            self.tree.delete(placeholder)
+        for index, path, name, size, folder_entry in added:
+            item_id = self.tree.insert(parent, index, text=name, values=("" if folder_entry else size,))
+            self.rows[path] = item_id
+            self.paths[item_id] = path
+            if folder_entry:
+                # Dummy child so Tk draws an expander; replaced on first open
+                self.folders.add(path)
+                self.placeholders[path] = self.tree.insert(item_id, "end", text="Loading...")
+        for index, path, name, size, folder_entry in changed:
+            self.tree.set(self.rows[path], "size", size)
         
-        color = f'#{r:02x}{g:02x}{b:02x}'
-        
-        tag_name = f"fade_{item_id}_{seconds_left}"
-        self.tree.tag_configure(tag_name, background=color)
-        self.tree.item(item_id, tags=(tag_name,))
-        
-        self.root.after(1000, lambda: self.fade_item(item_id, seconds_left - 1) if self.running else None)
+        # Everything is "added" the first time a folder is listed; don't highlight that
+        if folder in self.loaded_dirs:
+            self.highlighter.highlight([self.rows[path] for _, path, _, _, _ in added + changed])
+        self.loaded_dirs.add(folder)
+
+    def forget_subtree(self, path):
+        # Drop index entries for a row and everything below it (Tk deletes the items themselves)
+        prefix = path.rstrip("/") + "/"
+        for p in [p for p in self.rows if p == path or p.startswith(prefix)]:
+            item_id = self.rows.pop(p)
+            self.paths.pop(item_id, None)
+            self.folders.discard(p)
+            self.loaded_dirs.discard(p)
+            self.placeholders.pop(p, None)
+            self.highlighter.forget([item_id])
 
     def upload(self):
         if not self.connected or not self.running: return
@@ -373,52 +1085,257 @@ class Ray5App:
         if not paths: return
         self.perform_upload(paths)
 
-    def perform_upload(self, paths):
+    def engrave_image(self, image=""):
+        if not self.connected or not self.running: return
+        EngraveDialog(self, image)
+
+    def toggle_sync_mode(self):
+        self.last_config["sync_mode"] = self.sync_var.get()
+        self.write_config()
+
+    def toggle_minify(self):
+        self.last_config.setdefault("minify", {})["enabled"] = self.minify_var.get()
+        self.write_config()
+        # Applies from the next upload, including jobs already queued
+        self.client.transform = minifier_from_config(self.last_config)
+
+    def toggle_watch(self):
+        settings = self.last_config.setdefault("watch", {})
+        if self.watch_var.get():
+            folder = settings.get("folder")
+            if not folder or not os.path.isdir(folder):
+                folder = filedialog.askdirectory(title="Folder to watch for G-code")
+                if not folder:
+                    self.watch_var.set(False)
+                    return
+            settings.update(folder=folder, enabled=True)
+            self.start_watch()
+        else:
+            settings["enabled"] = False
+            self.stop_watch()
+        self.write_config()
+
+    def start_watch(self):
+        # Settings: folder, remote_path, delete, settle, poll, poll_interval, patterns
+        settings = self.last_config.get("watch", {})
+        self.stop_watch()
+        self.watcher = FolderSync(
+            settings["folder"],
+            self.on_watch_ready,
+            self.on_watch_removed if settings.get("delete") else None,
+            patterns=tuple(settings.get("patterns", DEFAULT_PATTERNS)),
+            settle=settings.get("settle", 2.0),
+            poll_interval=settings.get("poll_interval", 1.0),
+            use_inotify=not settings.get("poll", False),
+        )
+        self.watcher.start()
+        self.status_label.config(text=f"Watching {settings['folder']}")
+
+    def stop_watch(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        with self.watch_lock:
+            self.watch_held = {}
+
+    def on_watch_ready(self, batch):
+        # Called on the watcher thread with [(path, first_seen)], or the upload lane for held files
+        remote = self.last_config.get("watch", {}).get("remote_path", "/")
+        paths = [path for path, _ in batch]
+        for path, seen in batch:
+            if not self.sync_log.tracked(path):
+                self.sync_log.seen(path, seen)
+        with self.watch_lock:
+            if not self.connected:
+                # Unchanged files can only be skipped against the SD listing, so wait
+                # for the connection (the startup rescan usually comes before it)
+                for path, seen in batch:
+                    self.watch_held.setdefault(path, seen)
+                log.info(f"Watch: not connected, holding {len(self.watch_held)} file(s)")
+                return
+        client = self.client
+        device = self.current_device()
+        paths, unchanged = self.manifest.plan(device, paths, client.list_files(remote), remote)
+        for path in unchanged:
+            self.sync_log.finished(path, "unchanged")
+        # Nobody is there to confirm, so files that fail the check are left out
+        paths, flagged = self.validate_upload(paths)
+        for path, report in flagged.items():
+            self.sync_log.finished(path, "rejected", violations=report.counts)
+            self.ui_queue.put(("status", f"Watch: {os.path.basename(path)} not uploaded, "
+                                         f"{report.total} G-code problem(s)"))
+        for job in self.uploads.add(paths, remote, device):
+            self.sync_log.write("queued", job.local_path, remote_path=remote)
+        if paths:
+            self.ui_queue.put(("status", f"Watch: queued {len(paths)} file(s) for {remote}"))
+
+    def on_watch_removed(self, paths):
+        # Delete propagation; only while connected, never retried later
+        remote = self.last_config.get("watch", {}).get("remote_path", "/")
+        if not self.connected:
+            log.warning(f"Not connected; {len(paths)} local delete(s) not propagated")
+            return
+        names = {os.path.basename(p): p for p in paths}
+        results = self.client.delete_files(list(names), remote)
+        for name, res in results.items():
+            self.sync_log.write("removed", names[name], remote_path=remote, ok=res.ok, detail=str(res))
+        self.post(self.refresh_list)
+
+    def perform_upload(self, paths, render=None):
+        """Queue local files for the selected SD folder; with `render` they are images engraved as G-code."""
         if not self.running: return
-        self.status_label.config(text=f"Uploading {len(paths)} file(s)...")
-        logging.info(f"Starting upload of {len(paths)} files")
+        folder = self.selected_folder()
+        self.status_label.config(text=f"Uploading {len(paths)} file(s) to {folder}...")
+        log.info(f"Starting upload of {len(paths)} files to {folder}")
+        
+        sync_mode = self.sync_var.get() and render is None
         
         def task():
-            uploaded_names = []
-            for path in paths:
-                if not self.running: return
-                if os.path.isdir(path): continue
-                res = self.client.upload_file(path)
-                if "successful" in res.lower():
-                    uploaded_names.append(os.path.basename(path))
-                else:
-                    logging.error(f"Failed to upload {os.path.basename(path)}: {res}")
+            files = [p for p in paths if not os.path.isdir(p)]
+            device = self.current_device()
+            if sync_mode and files:
+                self.ui_queue.put(("status", f"Checking {len(files)} file(s) against SD card..."))
+                files, unchanged = self.manifest.plan(device, files, self.client.list_files(folder), folder)
+                if unchanged:
+                    log.info(f"Skipping {len(unchanged)} unchanged file(s): "
+                             f"{', '.join(os.path.basename(p) for p in unchanged)}")
+            # Checked before anything is sent; files with problems wait for the user
+            files, flagged = self.validate_upload(files, render)
+            if flagged:
+                self.post(lambda: self.confirm_flagged(flagged, folder, device, render))
+            if files and render is not None:
+                for path in files:
+                    self.uploads.add([path], folder, device, filename=gcode_name(path), render=render)
+            elif files:
+                # The queue retries, verifies and records each file in the manifest
+                self.uploads.add(files, folder, device)
+            elif not flagged:
+                self.post(self.update_status_text)
             
-            if self.running:
-                self.root.after(0, lambda: self.update_status_text() if self.running else None)
-                self.root.after(0, lambda: self.refresh_list(new_filenames=uploaded_names) if self.running else None)
-            
-        threading.Thread(target=task, daemon=True).start()
+        self.runner.submit("upload", task)
+
+    def validate_upload(self, paths, render=None):
+        """Split paths into (clean, {path: ValidationReport}) by the pre-upload G-code check."""
+        if self.validation is None:
+            return paths, {}
+        machine, rules = self.validation
+        gcode = [p for p in paths
+                 if render is not None or any(fnmatch.fnmatch(p.lower(), pat) for pat in GCODE_PATTERNS)]
+        if gcode:
+            self.ui_queue.put(("status", f"Checking {len(gcode)} G-code file(s) against the machine limits..."))
+        flagged = {}
+        for path in gcode:
+            try:
+                if render is not None:
+                    chunks = shared_engraver(render).chunks(path)
+                    report = validate_chunks(chunks, machine, rules, gcode_name(path))
+                else:
+                    report = validate_file(path, machine, rules)
+            except (OSError, RuntimeError) as e:
+                # The upload reports unreadable files itself
+                log.warning(f"Could not check {path}: {e}")
+                continue
+            if not report.ok:
+                flagged[path] = report
+        return [p for p in paths if p not in flagged], flagged
+
+    def confirm_flagged(self, flagged, folder, device, render=None):
+        reports = list(flagged.values())
+        text = "\n\n".join(report.summary(3) for report in reports[:3])
+        if len(reports) > 3:
+            text += f"\n\n{len(reports) - 3} more file(s) with problems"
+        if not self.ask_confirm_centered("G-code check", f"{text}\n\nUpload anyway?", justify="left", wraplength=560):
+            self.status_label.config(text=f"Skipped {len(flagged)} file(s) that failed the G-code check")
+            return
+        for path in flagged:
+            filename = gcode_name(path) if render is not None else None
+            self.uploads.add([path], folder, device, filename=filename, render=render)
 
     def delete(self):
         if not self.connected or not self.running: return
-        selected = self.tree.selection()
-        if not selected: return
-        
-        filenames = [self.tree.item(i)['values'][0] for i in selected]
+        selected = [self.paths[i] for i in self.tree.selection() if i in self.paths]
+        skipped = [p for p in selected if p in self.folders]
+        if skipped:
+            log.warning(f"Folders are not deleted: {', '.join(skipped)}")
+        targets = [p for p in selected if p not in self.folders]
+        if not targets: return
         
-        # Custom confirmation dialog centered on app
-        if not self.ask_confirm_centered("Confirm Delete", f"Delete {', '.join(filenames)}?"):
+        # Custom confirmation dialog centered on app; one prompt for the whole batch
+        shown = ", ".join(targets[:10])
+        if len(targets) > 10:
+            shown += f" and {len(targets) - 10} more"
+        if not self.ask_confirm_centered("Confirm Delete", f"Delete {shown}?"):
             return
+        # A listing may have landed while the dialog was open
+        targets = [p for p in targets if p in self.rows]
+        if not targets: return
+        
+        # Grey the rows out now; each disappears as soon as the laser acknowledges it
+        item_ids = [self.rows[p] for p in targets]
+        self.highlighter.forget(item_ids)
+        for item_id in item_ids:
+            self.tree.item(item_id, tags=("deleting",))
+        self.status_label.config(text=f"Deleting {len(targets)} file(s)...")
+        client = self.client
+        by_folder = {}
+        for path in targets:
+            by_folder.setdefault(posixpath.dirname(path) or "/", []).append(posixpath.basename(path))
         
         def task():
-            for filename in filenames:
-                if not self.running: return
-                res = self.client.delete_file(filename)
-                if "failed" in res.lower() or "error" in res.lower():
-                    logging.error(f"Failed to delete {filename}: {res}")
+            failed, lingering, unverified, listings = [], [], [], {}
+            for folder, names in by_folder.items():
+                def on_result(name, res, folder=folder):
+                    path = join_remote(folder, name)
+                    if res.ok:
+                        self.post(lambda: self.remove_row(path))
+                    else:
+                        log.error(f"Failed to delete {path}: {res}")
+                        self.post(lambda: self.mark_delete_failed([path]))
+                
+                results = client.delete_files(names, folder, window=self.last_config.get("delete_window"),
+                                              on_result=on_result)
+                failed += [join_remote(folder, n) for n, res in results.items() if not res.ok]
+                # The delete command is fire-and-forget on some firmware; trust the listing
+                files = client.list_files(folder)
+                if files is None:
+                    # No listing to check against: leave the tree as the acknowledgements left it
+                    unverified += [join_remote(folder, n) for n, res in results.items() if res.ok]
+                    continue
+                listings[folder] = files
+                present = {f.get("name") for f in files}
+                lingering += [join_remote(folder, n) for n, res in results.items() if res.ok and n in present]
+            if lingering:
+                log.warning(f"{len(lingering)} acknowledged delete(s) still on the SD card: {', '.join(lingering)}")
+            if unverified:
+                log.warning(f"Could not list the SD card to confirm {len(unverified)} delete(s): "
+                            f"{', '.join(unverified)}")
             
-            if self.running:
-                self.root.after(0, lambda: self.refresh_list() if self.running else None)
+            def finish():
+                if client is not self.client or not self.connected: return
+                for folder, files in listings.items():
+                    self.apply_listing(folder, files)
+                self.mark_delete_failed(failed + lingering)
+                unchecked = f", {len(unverified)} unverified" if unverified else ""
+                self.status_label.config(text=f"Deleted {len(targets) - len(failed) - len(lingering)}/"
+                                              f"{len(targets)} file(s){unchecked}")
+            self.post(finish)
             
-        threading.Thread(target=task, daemon=True).start()
+        self.runner.submit("delete", task)
+
+    def remove_row(self, path):
+        item_id = self.rows.get(path)
+        if item_id is not None and self.tree.exists(item_id):
+            self.forget_subtree(path)
+            self.tree.delete(item_id)
+
+    def mark_delete_failed(self, paths):
+        for path in paths:
+            item_id = self.rows.get(path)
+            if item_id is not None:
+                self.highlighter.forget([item_id])
+                self.tree.item(item_id, tags=("delete_failed",))
 
-    def ask_confirm_centered(self, title, message):
+    def ask_confirm_centered(self, title, message, justify="center", wraplength=350):
         # Create a top-level window for confirmation
         dialog = tk.Toplevel(self.root)
         dialog.title(title)
@@ -429,7 +1346,7 @@ class Ray5App:
         main_frame = ttk.Frame(dialog, padding=20)
         main_frame.pack(fill="both", expand=True)
         
-        label = ttk.Label(main_frame, text=message, wraplength=350, justify="center")
+        label = ttk.Label(main_frame, text=message, wraplength=wraplength, justify=justify)
         label.pack(pady=(0, 20))
         
         result = tk.BooleanVar(value=False)
@@ -467,6 +1384,8 @@ class Ray5App:
 
 
 if __name__ == "__main__":
+    # Background writer for connector.log; levels come from config.json
+    setup_logging(ray5_client.load_config())
     if HAS_DND:
         root = TkinterDnD.Tk()
     else:
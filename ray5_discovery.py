@@ -0,0 +1,119 @@
+import asyncio
+import ipaddress
+import logging
+import re
+import socket
+import time
+import urllib.parse
+
+log = logging.getLogger("ray5.discovery")
+
+STA_MAC_RE = re.compile(r"STA \(([0-9A-F:]+)\)")
+
+
+def parse_sta_mac(info):
+    match = STA_MAC_RE.search(info or "")
+    return match.group(1) if match else None
+
+
+def local_ip():
+    # Connecting a UDP socket sends nothing, it just picks the outgoing interface
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(("10.255.255.255", 1))
+        return s.getsockname()[0]
+    except OSError:
+        return None
+    finally:
+        s.close()
+
+
+def scan_hosts(cidr=None, hint_ip=None):
+    """Addresses to sweep: `cidr` if given, else the /24 around `hint_ip` or this machine."""
+    if not cidr:
+        base = hint_ip or local_ip()
+        if not base:
+            return []
+        cidr = f"{base}/24"
+    network = ipaddress.ip_network(cidr, strict=False)
+    hosts = [str(h) for h in network.hosts()]
+    if hint_ip in hosts:
+        # The last known address is the most likely hit
+        hosts.remove(hint_ip)
+        hosts.insert(0, hint_ip)
+    return hosts
+
+
+async def probe_esp420(ip, port=8848, timeout=1.5):
+    """Send [ESP420] to one host; returns the response body or None."""
+    query = urllib.parse.quote("[ESP420]")
+    request = (
+        f"GET /command?plain={query} HTTP/1.0\r\n"
+        f"Host: {ip}:{port}\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode("ascii")
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        writer.write(request)
+        await writer.drain()
+        raw = await asyncio.wait_for(reader.read(), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    finally:
+        if writer is not None:
+            writer.close()
+    head, _, body = raw.partition(b"\r\n\r\n")
+    status = head.split(b"\r\n", 1)[0].split()
+    if len(status) < 2 or not status[0].startswith(b"HTTP/") or status[1] != b"200":
+        return None
+    return body.decode("utf-8", errors="ignore")
+
+
+async def scan_for_mac(mac, hosts, port=8848, concurrency=64, timeout=1.5):
+    """Probe `hosts` with at most `concurrency` connections in flight.
+
+    Returns (ip, info) for the first host whose STA MAC matches, or None.
+    Outstanding probes are cancelled as soon as a match is found.
+    """
+    target = mac.upper()
+    pending = iter(hosts)
+    found = asyncio.get_running_loop().create_future()
+
+    async def worker():
+        for ip in pending:
+            if found.done():
+                return
+            info = await probe_esp420(ip, port, timeout)
+            if info and "FW version" in info and (parse_sta_mac(info) or "").upper() == target:
+                if not found.done():
+                    found.set_result((ip, info))
+                return
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(1, min(concurrency, len(hosts))))]
+    done_all = asyncio.ensure_future(asyncio.gather(*workers))
+    try:
+        await asyncio.wait([found, done_all], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        done_all.cancel()
+    return found.result() if found.done() else None
+
+
+def find_laser(mac, cidr=None, hint_ip=None, port=8848, concurrency=64, timeout=1.5):
+    """Blocking wrapper around scan_for_mac for use from worker threads."""
+    hosts = scan_hosts(cidr, hint_ip)
+    if not hosts:
+        log.error("Network scan skipped: no local address to derive a subnet from")
+        return None
+    log.info(f"Scanning {len(hosts)} hosts for MAC {mac}...")
+    start = time.perf_counter()
+    result = asyncio.run(scan_for_mac(mac, hosts, port, concurrency, timeout))
+    elapsed = time.perf_counter() - start
+    if result:
+        log.info(f"Found {mac} at {result[0]} in {elapsed:.1f}s")
+    else:
+        log.info(f"MAC {mac} not found after {elapsed:.1f}s")
+    return result
@@ -0,0 +1,555 @@
+"""Streaming G-code minifier for uploads, and a checker that two files cut the same path.
+
+LightBurn and LaserGRBL raster output repeats a lot of modal state: every line
+carries G1, the same F and S, coordinates that did not change, trailing zeros,
+spaces and comments. The minifier drops those words and keeps everything else
+in order, one line at a time, so memory use does not depend on file size:
+
+    G1 X10.500 Y0.000 F3000 S0   ; row 1   ->   G1X10.5Y0F3000S0
+    G1 X12.000 Y0.000 F3000 S250           ->   X12S250
+
+By default numbers are only rewritten (10.500 -> 10.5), never rounded; with
+`precision` set, absolute (G90) coordinates are rounded to that many decimals.
+G91 increments are kept as written, as their rounding errors would add up
+from move to move. Anything the
+minifier does not track (`$` commands, checksummed lines, homing, offsets,
+unit changes) keeps its words and makes it forget the state it knew; a line
+passed through unparsed makes it forget all of it, since its words are unknown.
+
+Minifying is plain Python at about 1.7 MB/s (ray5_bench.py minify), so a few
+hundred MB take minutes. GcodeMinifier does it once per file: the upload needs
+the size up front, and the output written while measuring is kept in a temp
+file that the upload (and its retries) then send.
+
+verify() runs both files through an independent interpreter and compares the
+resulting moves, spindle changes and commands:
+
+    python ray5_gcode.py job.gcode -o job.min.gcode --verify
+"""
+import argparse
+import atexit
+import fnmatch
+import functools
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from itertools import zip_longest
+
+log = logging.getLogger("ray5.gcode")
+
+GCODE_PATTERNS = ("*.gcode", "*.gc", "*.nc", "*.ngc", "*.g")
+
+# Ray5 defaults, overridden by the config.json "machine" section.
+# Rates in mm/min (Grbl $110), acceleration in mm/s^2 ($120), work area
+# X by Y in mm ($130/$131) and the S for full laser power ($30).
+MACHINE_DEFAULTS = {
+    "rapid_rate": 6000.0,
+    "acceleration": 1000.0,
+    "work_area": [400.0, 400.0],
+    "max_power": 1000,
+}
+
+AXES = b"XYZABC"
+# Words rounded when a precision is given; F and S are left as written
+ROUNDED = frozenset(b"XYZABCIJKR")
+MOTION = {b"0", b"1", b"2", b"3"}
+# G codes the minifier tracks; any other G in a block makes it forget positions
+PLAIN_G = MOTION | {b"90", b"91", b"94"}
+
+_COMMENTS = re.compile(rb"\([^)]*\)|;.*")
+_SPACE = re.compile(rb"\s+")
+_WORD = re.compile(rb"([A-Z])([-+]?(?:\d+\.?\d*|\.\d+))")
+
+
+# Raster files repeat the same few S values and row coordinates over and over
+@functools.lru_cache(maxsize=4096)
+def normalize_number(text, places=None):
+    """b"+010.500" -> b"10.5"; rounds to `places` decimals first if given."""
+    if places is not None:
+        text = b"%.*f" % (places, float(text))
+    negative = text[:1] == b"-"
+    if text[:1] in b"+-":
+        text = text[1:]
+    whole, _, frac = text.partition(b".")
+    whole = whole.lstrip(b"0") or b"0"
+    frac = frac.rstrip(b"0")
+    out = whole + b"." + frac if frac else whole
+    return b"-" + out if negative and out != b"0" else out
+
+
+def parse_words(line):
+    """Upper-cased words of one line as [(letter, number)], or None if it isn't plain G-code."""
+    if b";" in line or b"(" in line:
+        line = _COMMENTS.sub(b"", line)
+    code = _SPACE.sub(b"", line).upper()
+    if not code:
+        return []
+    words = _WORD.findall(code)
+    if sum(len(l) + len(n) for l, n in words) != len(code):
+        return None
+    return words
+
+
+def is_passthrough(line):
+    # Grbl system commands, tape markers, ESP3D commands and checksummed lines
+    return line[:1] in (b"$", b"%", b"[") or b"*" in line
+
+
+class Minifier:
+    """Rewrites G-code lines; keeps the modal state needed to know what is redundant."""
+
+    def __init__(self, precision=None):
+        self.precision = precision
+        self.reset()
+
+    def reset(self):
+        self.motion = None
+        self.absolute = None
+        self.inverse_time = False
+        self.feed = None
+        self.spindle = None
+        self.position = {}
+
+    def number(self, letter, value, absolute):
+        places = self.precision if absolute and letter in ROUNDED else None
+        return normalize_number(value, places)
+
+    def line(self, raw):
+        """Minified bytes for one input line, without newline; b"" when nothing is left."""
+        stripped = raw.strip()
+        if is_passthrough(stripped):
+            # May set motion, feed or S (N5 G0 X20 S0*71): the next line restates them
+            self.reset()
+            return stripped
+        words = parse_words(stripped)
+        if words is None:
+            self.reset()
+            return _COMMENTS.sub(b"", stripped).strip()
+        # Round in the distance mode this block moves in
+        absolute = self.absolute
+        for l, n in words:
+            if l == b"G" and normalize_number(n) in (b"90", b"91"):
+                absolute = normalize_number(n) == b"90"
+        words = [(ord(l), self.number(ord(l), n, absolute)) for l, n in words]
+        gs = [n for l, n in words if l == 71]  # G
+        if any(g not in PLAIN_G for g in gs) or any(l == 77 and n in (b"2", b"30") for l, n in words):
+            return self.special(words, gs)
+
+        for g in gs:
+            if g in (b"90", b"91"):
+                self.absolute = g == b"90"
+            elif g == b"94":
+                self.inverse_time = False
+        motion = next((g for g in gs if g in MOTION), None)
+        keep_motion = motion is not None and motion != self.motion
+        if motion is not None:
+            self.motion = motion
+        linear = self.absolute and self.motion in (b"0", b"1")
+
+        out = []
+        for letter, value in words:
+            if letter == 71:
+                if value in MOTION and not keep_motion:
+                    continue
+            elif letter == 70:  # F
+                if value == self.feed and not self.inverse_time:
+                    continue
+                self.feed = value
+            elif letter == 83:  # S
+                if value == self.spindle:
+                    continue
+                self.spindle = value
+            elif letter in AXES:
+                if linear and self.position.get(letter) == value:
+                    continue
+                if self.absolute:
+                    self.position[letter] = value
+                else:
+                    self.position.pop(letter, None)
+            out.append(b"%c%s" % (letter, value))
+        return b"".join(out)
+
+    def special(self, words, gs):
+        # Homing, offsets, units, probing, program end...: pass the block through and
+        # forget what it may have changed
+        for g in gs:
+            if g in MOTION or g == b"80":
+                self.motion = None if g == b"80" else g
+            elif g in (b"90", b"91"):
+                self.absolute = g == b"90"
+            elif g in (b"93", b"94"):
+                self.inverse_time = g == b"93"
+        self.position.clear()
+        self.feed = None
+        for letter, value in words:
+            if letter == 83:
+                self.spindle = value
+        if any(l == 77 and n in (b"2", b"30") for l, n in words):
+            self.reset()
+        return b"".join(b"%c%s" % (l, n) for l, n in words)
+
+    def lines(self, source):
+        """Yield minified lines (with b"\\n") for an iterable of input lines."""
+        for raw in source:
+            out = self.line(raw)
+            if out:
+                yield out + b"\n"
+
+
+@dataclass(slots=True)
+class MinifyReport:
+    bytes_in: int = 0
+    bytes_out: int = 0
+    lines_in: int = 0
+    lines_out: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def saved(self):
+        return self.bytes_in - self.bytes_out
+
+    @property
+    def percent(self):
+        return 100.0 * self.saved / self.bytes_in if self.bytes_in else 0.0
+
+    def __str__(self):
+        return (f"{self.bytes_in} -> {self.bytes_out} bytes ({self.percent:.1f}% saved), "
+                f"{self.lines_in} -> {self.lines_out} lines in {self.elapsed:.2f}s")
+
+
+def minify_file(src_path, dst=None, precision=None):
+    """Minify `src_path`, writing to the binary file object `dst` (just measure if None)."""
+    report = MinifyReport()
+    start = time.perf_counter()
+    minifier = Minifier(precision)
+    with open(src_path, "rb") as src:
+        for raw in src:
+            report.bytes_in += len(raw)
+            report.lines_in += 1
+            out = minifier.line(raw)
+            if out:
+                report.bytes_out += len(out) + 1
+                report.lines_out += 1
+                if dst is not None:
+                    dst.write(out + b"\n")
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+class ChunkReader:
+    """File-like read() over an iterator of byte chunks, pulled only as far as needed."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def read(self, size=-1):
+        while self._chunks is not None and (size is None or size < 0 or len(self._buffer) < size):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._chunks = None
+                break
+            self._buffer += chunk
+        if size is None or size < 0:
+            size = len(self._buffer)
+        out = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return out
+
+    def close(self):
+        self._chunks = None
+
+
+class MinifiedReader(ChunkReader):
+    """The minified form of a file, produced as it is read."""
+
+    def __init__(self, path, precision=None):
+        self._file = open(path, "rb")
+        super().__init__(Minifier(precision).lines(self._file))
+
+    def close(self):
+        super().close()
+        self._file.close()
+
+
+class SpoolCache:
+    """Temp files holding generated upload bodies, by key, so they are produced once.
+
+    Keys start with the source's absolute path; a new spool replaces the older
+    ones of the same path, and only the `limit` most recent are kept.
+    """
+
+    def __init__(self, limit=4, suffix=".gcode"):
+        self.limit = limit
+        self.suffix = suffix
+        self.files = {}
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def write(self, key, fill):
+        """Call fill(binary file) on a new spool for `key`; returns what fill returns."""
+        fd, spool = tempfile.mkstemp(prefix="ray5_", suffix=self.suffix)
+        try:
+            with os.fdopen(fd, "wb") as dst:
+                result = fill(dst)
+        except BaseException:
+            self.discard(spool)
+            raise
+        with self.lock:
+            old = [k for k in self.files if k[0] == key[0]]
+            self.files[key] = spool
+            # Oldest first: dicts keep insertion order
+            old += list(self.files)[:max(0, len(self.files) - self.limit)]
+            stale = [self.files.pop(k) for k in dict.fromkeys(old) if k != key]
+        for name in stale:
+            self.discard(name)
+        return result
+
+    def open(self, key):
+        """The spool for `key` opened for reading, or None."""
+        with self.lock:
+            spool = self.files.get(key)
+        if spool is not None:
+            try:
+                return open(spool, "rb")
+            except OSError:
+                pass
+        return None
+
+    def discard(self, spool):
+        try:
+            os.remove(spool)
+        except OSError as e:
+            # Still open by an upload on Windows; the temp dir is cleaned eventually
+            log.debug(f"Could not remove {spool}: {e}")
+
+    def close(self):
+        """Delete all spools."""
+        with self.lock:
+            spools, self.files = list(self.files.values()), {}
+        for spool in spools:
+            self.discard(spool)
+
+
+class GcodeMinifier:
+    """Upload transform: G-code files are sent minified, anything else as is.
+
+    The body length has to be known before sending, so each file is minified once
+    to measure it. The output goes to a temp file (spool) that open() then reads,
+    so the file is not minified a second time; reports and spools are cached by
+    path, size and mtime, keeping the `max_spools` most recent.
+    """
+
+    def __init__(self, precision=None, patterns=GCODE_PATTERNS, max_spools=4):
+        self.precision = precision
+        self.patterns = patterns
+        self.reports = {}
+        self.spools = SpoolCache(max_spools, ".min.gcode")
+        self.lock = threading.Lock()
+
+    def applies(self, path):
+        name = os.path.basename(path).lower()
+        return any(fnmatch.fnmatch(name, p) for p in self.patterns)
+
+    def key(self, path):
+        st = os.stat(path)
+        return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+    def measure(self, path):
+        key = self.key(path)
+        with self.lock:
+            report = self.reports.get(key)
+        if report is None:
+            report = self.spools.write(key, lambda dst: minify_file(path, dst, self.precision))
+            with self.lock:
+                self.reports[key] = report
+            log.info(f"Minified {os.path.basename(path)}: {report}")
+        return report
+
+    def output_size(self, path):
+        return self.measure(path).bytes_out
+
+    def open(self, path):
+        return self.spools.open(self.key(path)) or MinifiedReader(path, self.precision)
+
+    def close(self):
+        """Delete the spooled output."""
+        with self.lock:
+            self.reports.clear()
+        self.spools.close()
+
+
+def minifier_from_config(config):
+    """The config.json "minify" section as a GcodeMinifier, or None when disabled.
+
+        "minify": {"enabled": true, "precision": 3}
+    """
+    settings = config.get("minify") or {}
+    if not settings.get("enabled"):
+        return None
+    return GcodeMinifier(settings.get("precision"), tuple(settings.get("patterns", GCODE_PATTERNS)))
+
+
+def machine_from_config(config):
+    return {**MACHINE_DEFAULTS, **(config.get("machine") or {})}
+
+
+class _Interpreter:
+    """Reduces a G-code file to what the machine does: moves, S changes and other commands.
+
+    Written separately from Minifier, on floats, so verify() does not share its mistakes.
+    """
+
+    def __init__(self, tolerance=1e-9):
+        self.tolerance = tolerance
+        self.reset()
+
+    def reset(self):
+        self.motion = None
+        self.absolute = None
+        self.inverse_time = False
+        self.feed = None
+        self.spindle = None
+        self.position = {}
+
+    def events(self, path):
+        """Yield (line_number, event) tuples."""
+        with open(path, "rb") as f:
+            for number, raw in enumerate(f, 1):
+                for event in self.block(raw.strip()):
+                    yield number, event
+
+    def block(self, line):
+        if is_passthrough(line):
+            self.reset()
+            return [("raw", line)]
+        words = parse_words(line)
+        if words is None:
+            self.position = {}
+            return [("raw", _COMMENTS.sub(b"", line).strip())]
+        if not words:
+            return []
+        values = [(l.decode(), float(n)) for l, n in words]
+        gs = [n for l, n in values if l == "G"]
+        ms = [n for l, n in values if l == "M"]
+        events = []
+        if any(g not in (0, 1, 2, 3, 90, 91, 94) for g in gs) or any(m in (2, 30) for m in ms):
+            events.append(("block", tuple(values)))
+            for g in gs:
+                if g in (0, 1, 2, 3, 80):
+                    self.motion = None if g == 80 else g
+                elif g in (90, 91):
+                    self.absolute = g == 90
+                elif g in (93, 94):
+                    self.inverse_time = g == 93
+            self.position = {}
+            self.feed = None
+            if any(m in (2, 30) for m in ms):
+                self.reset()
+            return events
+
+        for g in gs:
+            if g in (90, 91):
+                self.absolute = g == 90
+            elif g == 94:
+                self.inverse_time = False
+            else:
+                self.motion = g
+        params = {}
+        for letter, value in values:
+            if letter == "F":
+                self.feed = value
+            elif letter == "S":
+                if value != self.spindle:
+                    self.spindle = value
+                    events.append(("S", value))
+            elif letter == "M":
+                events.append(("M", value))
+            elif letter not in "GN":
+                params[letter] = value
+
+        axes = {l: v for l, v in params.items() if l in "XYZABC"}
+        if not axes:
+            others = tuple(sorted(params.items()))
+            if others:
+                events.append(("words", others))
+            return events
+        before = dict(self.position)
+        for letter, value in axes.items():
+            if self.absolute:
+                self.position[letter] = value
+            else:
+                # Increments add up from where the last reset left off (0): both files
+                # reset on the same lines, so their sums are compared, not each step
+                self.position[letter] = self.position.get(letter, 0.0) + value
+        if self.motion in (0, 1) and self.absolute and all(
+                l in before and abs(before[l] - v) <= self.tolerance for l, v in axes.items()):
+            # Zero-length move
+            return events
+        target = tuple((l, self.position[l]) for l in "XYZABC" if l in self.position)
+        arc = tuple(sorted((l, v) for l, v in params.items() if l not in "XYZABC"))
+        events.append(("move", self.motion, target, self.feed, arc))
+        return events
+
+
+def _same(a, b, tolerance):
+    if isinstance(a, float) and isinstance(b, float):
+        return abs(a - b) <= tolerance
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        return len(a) == len(b) and all(_same(x, y, tolerance) for x, y in zip(a, b))
+    return a == b
+
+
+def verify(original, minified, tolerance=1e-9):
+    """Check that two G-code files drive the machine the same way.
+
+    Returns (ok, message); on a difference the message names the line in each file.
+    Moves are compared by where they end, G91 increments summed up, so rounding
+    that drifts over many moves fails. Use a tolerance of half a unit in the last
+    decimal when the minifier rounded.
+    """
+    a_events = _Interpreter(tolerance).events(original)
+    b_events = _Interpreter(tolerance).events(minified)
+    count = 0
+    for a, b in zip_longest(a_events, b_events):
+        if a is None or b is None:
+            extra, where = (b, minified) if a is None else (a, original)
+            return False, f"{os.path.basename(where)} line {extra[0]} has extra {extra[1]!r}"
+        if not _same(a[1], b[1], tolerance):
+            return False, (f"{os.path.basename(original)} line {a[0]} {a[1]!r} differs from "
+                           f"{os.path.basename(minified)} line {b[0]} {b[1]!r}")
+        count += 1
+    return True, f"{count} events match"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Minify G-code for upload and check the result.")
+    parser.add_argument("input")
+    parser.add_argument("-o", "--output", help="write the minified file here (default: only report)")
+    parser.add_argument("--precision", type=int, help="round G90 coordinates to this many decimals")
+    parser.add_argument("--verify", action="store_true", help="check the output against the input")
+    args = parser.parse_args(argv)
+
+    if args.output:
+        with open(args.output, "wb") as dst:
+            report = minify_file(args.input, dst, args.precision)
+    else:
+        report = minify_file(args.input, precision=args.precision)
+    print(report)
+    if args.verify:
+        if not args.output:
+            parser.error("--verify needs --output")
+        tolerance = 0.5 * 10 ** -args.precision + 1e-9 if args.precision is not None else 1e-9
+        ok, message = verify(args.input, args.output, tolerance)
+        print(("OK: " if ok else "MISMATCH: ") + message)
+        return 0 if ok else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
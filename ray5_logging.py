@@ -0,0 +1,142 @@
+"""Logging setup for the GUI: a queue in front of the file so no thread waits on disk.
+
+Every logger call only puts the record on a queue; a QueueListener thread formats
+and writes it. connector.log rolls over at local midnight or when it reaches
+max_bytes, and old logs are gzipped (connector.log.1.gz, .2.gz, ...).
+
+Subsystems log to "ray5.*" loggers (ray5.client, ray5.upload, ray5.keepalive,
+ray5.async, ray5.discovery, ray5.metrics, ray5.gcode, ray5.analyze, ray5.raster,
+ray5.validate, ray5.gui)
+whose levels can be set in config.json:
+
+    "logging": {"level": "INFO", "levels": {"ray5.keepalive": "WARNING"},
+                "max_bytes": 5242880, "backup_count": 10, "daily": true,
+                "keepalive_interval": 60}
+"""
+import atexit
+import datetime
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import time
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+
+DEFAULT_LEVELS = {
+    # urllib3 logs every pooled connection at DEBUG
+    "urllib3": "WARNING",
+}
+
+
+def gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def gzip_namer(name):
+    return name + ".gz"
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that also rolls over at local midnight and gzips old files."""
+
+    def __init__(self, filename, max_bytes=5 * 1024 * 1024, backup_count=10, daily=True):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.namer = gzip_namer
+        self.rotator = gzip_rotator
+        self.daily = daily
+        started = os.path.getmtime(filename) if os.path.exists(filename) else time.time()
+        self.rollover_at = self.next_midnight(started)
+
+    @staticmethod
+    def next_midnight(timestamp):
+        day = datetime.date.fromtimestamp(timestamp) + datetime.timedelta(days=1)
+        return datetime.datetime.combine(day, datetime.time()).timestamp()
+
+    def shouldRollover(self, record):
+        if self.daily and record.created >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        if not os.path.exists(self.baseFilename) or os.path.getsize(self.baseFilename) == 0:
+            # Nothing written since the last rollover
+            self.rollover_at = self.next_midnight(time.time())
+            return
+        super().doRollover()
+        self.rollover_at = self.next_midnight(time.time())
+
+
+class RateLimitFilter(logging.Filter):
+    """Let a given message through at most once per `interval` seconds.
+
+    Messages are keyed by their format string, so "Keepalive to {ip} failed" with
+    different errors still counts as one message. The next record let through
+    carries the number suppressed in between.
+    """
+
+    def __init__(self, interval=60.0):
+        super().__init__()
+        self.interval = interval
+        self.last = {}
+        self.suppressed = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.levelno, record.msg if isinstance(record.msg, str) else repr(record.msg))
+        now = record.created
+        with self.lock:
+            if now - self.last.get(key, float("-inf")) < self.interval:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False
+            self.last[key] = now
+            skipped = self.suppressed.pop(key, 0)
+        if skipped:
+            record.msg = f"{record.getMessage()} ({skipped} similar suppressed)"
+            record.args = None
+        return True
+
+
+def setup_logging(config=None, path="connector.log", console=True):
+    """Install the queue handler on the root logger and start the writer thread.
+
+    Returns the QueueListener; stop it with stop_listener(), which also runs at exit.
+    """
+    settings = (config or {}).get("logging", {})
+    handlers = [CompressingRotatingFileHandler(
+        path,
+        max_bytes=settings.get("max_bytes", 5 * 1024 * 1024),
+        backup_count=settings.get("backup_count", 10),
+        daily=settings.get("daily", True),
+    )]
+    if console:
+        handlers.append(logging.StreamHandler())
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(settings.get("level", "INFO"))
+    for name, level in {**DEFAULT_LEVELS, **settings.get("levels", {})}.items():
+        logging.getLogger(name).setLevel(level)
+    logging.getLogger("ray5.keepalive").addFilter(RateLimitFilter(settings.get("keepalive_interval", 60.0)))
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_listener, listener)
+    return listener
+
+
+def stop_listener(listener):
+    # Flush whatever is still queued; safe to call more than once
+    if listener._thread is not None:
+        listener.stop()
@@ -0,0 +1,199 @@
+"""Per-endpoint request metrics for the laser link.
+
+Every Ray5Client / AsyncRay5Client request is recorded in the shared METRICS
+registry under its host and endpoint (/files, /upload, /command): request count,
+failures by category, bytes transferred and a latency histogram. The GUI shows a
+summary of it, and MetricsServer can expose it in Prometheus text format:
+
+    curl http://127.0.0.1:9105/metrics
+"""
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger("ray5.metrics")
+
+# Seconds; wide enough for slow multi-megabyte uploads
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate like Prometheus' histogram_quantile: linear within the matching bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                if i == len(self.bounds):
+                    return lower
+                return lower + (self.bounds[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+
+class EndpointStats:
+    __slots__ = ("requests", "errors", "bytes", "latency", "last_error")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = {}
+        self.bytes = 0
+        self.latency = Histogram()
+        self.last_error = None
+
+    @property
+    def error_count(self):
+        return sum(self.errors.values())
+
+
+class Metrics:
+    """Thread-safe registry keyed by (host, endpoint)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.started = time.time()
+
+    def observe(self, host, endpoint, elapsed, ok=True, nbytes=0, category=None):
+        with self.lock:
+            stats = self.stats.get((host, endpoint))
+            if stats is None:
+                stats = self.stats[(host, endpoint)] = EndpointStats()
+            stats.requests += 1
+            stats.bytes += nbytes
+            stats.latency.observe(elapsed)
+            if not ok:
+                category = category or "unknown"
+                stats.errors[category] = stats.errors.get(category, 0) + 1
+                stats.last_error = time.time()
+
+    def record(self, host, endpoint, result):
+        """Record an OpResult."""
+        self.observe(host, endpoint, result.elapsed, result.ok, result.bytes, result.category)
+
+    def summary(self, host=None):
+        """{endpoint: {requests, errors, bytes, p50, p95, p99}} for one host (all hosts if None)."""
+        merged = {}
+        with self.lock:
+            for (h, endpoint), stats in self.stats.items():
+                if host is not None and h != host:
+                    continue
+                m = merged.setdefault(endpoint, EndpointStats())
+                m.requests += stats.requests
+                m.bytes += stats.bytes
+                for category, n in stats.errors.items():
+                    m.errors[category] = m.errors.get(category, 0) + n
+                m.latency.count += stats.latency.count
+                m.latency.sum += stats.latency.sum
+                m.latency.counts = [a + b for a, b in zip(m.latency.counts, stats.latency.counts)]
+        return {
+            endpoint: {
+                "requests": m.requests,
+                "errors": m.error_count,
+                "bytes": m.bytes,
+                "p50": m.latency.quantile(0.5),
+                "p95": m.latency.quantile(0.95),
+                "p99": m.latency.quantile(0.99),
+            }
+            for endpoint, m in sorted(merged.items())
+        }
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.started = time.time()
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP ray5_requests_total Requests sent to the laser.",
+            "# TYPE ray5_requests_total counter",
+        ]
+        with self.lock:
+            items = sorted(self.stats.items())
+            for (host, endpoint), s in items:
+                lines.append(f'ray5_requests_total{{host="{host}",endpoint="{endpoint}"}} {s.requests}')
+            lines += ["# HELP ray5_request_errors_total Failed requests by category.",
+                      "# TYPE ray5_request_errors_total counter"]
+            for (host, endpoint), s in items:
+                for category, n in sorted(s.errors.items()):
+                    lines.append(f'ray5_request_errors_total{{host="{host}",endpoint="{endpoint}",'
+                                 f'category="{category}"}} {n}')
+            lines += ["# HELP ray5_transfer_bytes_total Bytes sent and received.",
+                      "# TYPE ray5_transfer_bytes_total counter"]
+            for (host, endpoint), s in items:
+                lines.append(f'ray5_transfer_bytes_total{{host="{host}",endpoint="{endpoint}"}} {s.bytes}')
+            lines += ["# HELP ray5_request_seconds Request latency.",
+                      "# TYPE ray5_request_seconds histogram"]
+            for (host, endpoint), s in items:
+                labels = f'host="{host}",endpoint="{endpoint}"'
+                cumulative = 0
+                for bound, n in zip(s.latency.bounds + (None,), s.latency.counts):
+                    cumulative += n
+                    le = "+Inf" if bound is None else repr(bound)
+                    lines.append(f'ray5_request_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"ray5_request_seconds_sum{{{labels}}} {s.latency.sum:.6f}")
+                lines.append(f"ray5_request_seconds_count{{{labels}}} {s.latency.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by every client in the process
+METRICS = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """Serves `metrics` as Prometheus text on a background thread (localhost only by default)."""
+
+    def __init__(self, metrics=METRICS, host="127.0.0.1", port=9105):
+        self.httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.metrics = metrics
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        log.info(f"Serving metrics on http://{self.httpd.server_address[0]}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,320 @@
+"""Engrave images: grayscale/dither an image and stream it to the laser as raster G-code.
+
+The image is scaled to `width` mm with one pixel per `interval` mm (square
+pixels, so rows are `interval` apart), converted to laser power per pixel and
+written row by row, alternating direction when `bidirectional` is set:
+
+    floyd      Floyd-Steinberg error diffusion, on/off at `power`
+    ordered    8x8 Bayer matrix, on/off at `power`
+    threshold  on below 50% brightness
+    grayscale  `min_power`..`power` by darkness, in `levels` steps
+
+Runs of pixels with the same power become one G1, blank rows are skipped, each
+row starts at its first dark pixel and blank gaps longer than `skip_gap` mm are
+crossed with G0. The job runs in M4 (dynamic power) mode, so the laser is off
+whenever the head is not moving.
+
+RasterEngraver renders the G-code once into a temp file, which the pre-upload
+check, the run time estimate, the Content-Length and the upload itself all read;
+shared_engraver() hands every user of the same settings the same engraver.
+Loading images needs Pillow (pip install pillow) and numpy.
+
+    python ray5_raster.py logo.png --width 80 --mode ordered -o logo.gcode
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+
+from ray5_gcode import ChunkReader, SpoolCache
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+try:
+    from PIL import Image
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+log = logging.getLogger("ray5.raster")
+
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg", "*.bmp", "*.gif", "*.tif", "*.tiff", "*.webp")
+MODES = ("floyd", "ordered", "threshold", "grayscale")
+# Bytes per chunk when reading a rendered spool back
+READ_SIZE = 1024 * 1024
+
+# Overridden by the config.json "raster" section and the Engrave Image dialog
+RASTER_DEFAULTS = {
+    "width": 50.0,          # mm
+    "interval": 0.1,        # mm between rows and pixels
+    "mode": "floyd",
+    "power": 1000,          # S for black
+    "min_power": 0,         # S for the lightest non-white grey (grayscale mode)
+    "levels": 32,           # grayscale power steps; fewer steps merge into longer runs
+    "feed": 3000,           # mm/min while burning
+    "origin": [0.0, 0.0],   # mm, bottom left corner of the image
+    "bidirectional": True,
+    "skip_gap": 2.0,        # mm of blank run crossed with G0 instead of G1 S0
+    "negative": False,
+}
+
+BAYER_8 = None
+
+
+def raster_settings(config, **overrides):
+    return {**RASTER_DEFAULTS, **(config.get("raster") or {}), **overrides}
+
+
+def load_image(path, width, interval):
+    """Grey levels (0 black .. 1 white) of `path` scaled to width/interval pixels per row."""
+    if not (HAS_PIL and HAS_NUMPY):
+        raise RuntimeError("engraving images needs Pillow and numpy (pip install pillow numpy)")
+    with Image.open(path) as img:
+        if img.mode in ("RGBA", "LA", "P"):
+            # Transparent areas are not engraved
+            img = img.convert("RGBA")
+            background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+            img = Image.alpha_composite(background, img)
+        img = img.convert("L")
+        cols = max(1, round(width / interval))
+        rows = max(1, round(cols * img.height / img.width))
+        img = img.resize((cols, rows), Image.LANCZOS)
+        return np.asarray(img, dtype=np.float64) / 255.0
+
+
+def floyd_steinberg(gray):
+    """Boolean burn mask by Floyd-Steinberg error diffusion.
+
+    Pixel (y, x) only depends on pixels with a smaller x + 2y, so each such
+    anti-diagonal is processed as one vector step: width + 2 * height steps.
+    """
+    h, w = gray.shape
+    buf = np.zeros((h + 1, w + 2))
+    buf[:h, 1:w + 1] = gray
+    burn = np.zeros((h, w), bool)
+    for t in range(w + 2 * (h - 1)):
+        ys = np.arange(max(0, (t - w + 2) // 2), min(h - 1, t // 2) + 1)
+        if not len(ys):
+            continue
+        xs = t - 2 * ys + 1
+        old = buf[ys, xs]
+        white = old >= 0.5
+        burn[ys, xs - 1] = ~white
+        err = old - white
+        # Separate statements: targets repeat across these four, never within one
+        buf[ys, xs + 1] += err * (7 / 16)
+        buf[ys + 1, xs - 1] += err * (3 / 16)
+        buf[ys + 1, xs] += err * (5 / 16)
+        buf[ys + 1, xs + 1] += err * (1 / 16)
+    return burn
+
+
+def ordered_dither(gray):
+    global BAYER_8
+    if BAYER_8 is None:
+        m = np.array([[0, 2], [3, 1]])
+        for _ in range(2):
+            m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+        BAYER_8 = (m + 0.5) / 64
+    h, w = gray.shape
+    return gray < np.tile(BAYER_8, (h // 8 + 1, w // 8 + 1))[:h, :w]
+
+
+def power_map(gray, settings):
+    """S value per pixel as an integer array (0 = laser off)."""
+    mode = settings["mode"]
+    if settings["negative"]:
+        gray = 1.0 - gray
+    power = int(settings["power"])
+    if mode == "floyd":
+        return floyd_steinberg(gray).astype(np.int32) * power
+    if mode == "ordered":
+        return ordered_dither(gray).astype(np.int32) * power
+    if mode == "threshold":
+        return (gray < 0.5).astype(np.int32) * power
+    if mode == "grayscale":
+        levels = max(1, int(settings["levels"]))
+        darkness = np.ceil((1.0 - gray) * levels) / levels
+        low = int(settings["min_power"])
+        return np.where(darkness > 0, np.rint(low + darkness * (power - low)), 0).astype(np.int32)
+    raise ValueError(f"unknown raster mode {mode!r}")
+
+
+def _mm(value):
+    return f"{value:.3f}".rstrip("0").rstrip(".")
+
+
+def gcode_chunks(power, settings, title="image"):
+    """Yield the raster G-code for a power map, one bytes chunk per image row."""
+    rows, cols = power.shape
+    px = float(settings["interval"])
+    x0, y0 = (float(v) for v in settings["origin"])
+    skip = float(settings["skip_gap"])
+    edges = [_mm(x0 + i * px) for i in range(cols + 1)]
+    yield (f"; Ray5 Connector raster: {title}, {cols}x{rows} px at {px} mm, {settings['mode']}\n"
+           f"G21\nG90\nM4 S0\nG1 F{settings['feed']}\n").encode("ascii")
+    motion, level = "G1", 0
+    forward = True
+    for r in range(rows):
+        row = power[r]
+        lit = np.flatnonzero(row)
+        if not len(lit):
+            continue
+        lo, hi = int(lit[0]), int(lit[-1]) + 1
+        starts = np.flatnonzero(np.diff(row[lo:hi])) + 1 + lo
+        bounds = [lo, *starts.tolist(), hi]
+        values = row[[lo, *starts.tolist()]].tolist()
+        y = _mm(y0 + (rows - 1 - r) * px)
+        if forward:
+            spans = zip(bounds[1:], values, bounds[:-1])
+            out = [f"G0X{edges[lo]}Y{y}"]
+        else:
+            spans = zip(reversed(bounds[:-1]), reversed(values), reversed(bounds[1:]))
+            out = [f"G0X{edges[hi]}Y{y}"]
+        motion = "G0"
+        for target, value, begin in spans:
+            if value == 0 and abs(target - begin) * px > skip:
+                word = "G0"
+                line = f"X{edges[target]}"
+            else:
+                word = "G1"
+                line = f"X{edges[target]}"
+                if value != level:
+                    line += f"S{value}"
+                    level = value
+            out.append(line if word == motion else word + line)
+            motion = word
+        out.append("")
+        yield "\n".join(out).encode("ascii")
+        if settings["bidirectional"]:
+            forward = not forward
+    yield b"M5 S0\n"
+
+
+class RasterEngraver:
+    """Upload source that sends an image as G-code.
+
+    Used like the upload transforms in ray5_client: output_size(path) for the
+    Content-Length, open(path) for the body. The G-code is rendered once per
+    image into a spool that chunks(), output_size() and open() read.
+    """
+
+    def __init__(self, settings, max_spools=4):
+        self.settings = {**RASTER_DEFAULTS, **settings}
+        self.lock = threading.Lock()
+        self._power = (None, None)
+        self._sizes = {}
+        self.spools = SpoolCache(max_spools)
+
+    def applies(self, path):
+        return True
+
+    def key(self, path):
+        st = os.stat(path)
+        return os.path.abspath(path), st.st_size, st.st_mtime_ns, json.dumps(self.settings, sort_keys=True)
+
+    def power(self, path):
+        key = self.key(path)
+        with self.lock:
+            if self._power[0] == key:
+                return self._power[1]
+        gray = load_image(path, float(self.settings["width"]), float(self.settings["interval"]))
+        power = power_map(gray, self.settings)
+        with self.lock:
+            self._power = (key, power)
+        return power
+
+    def render(self, path):
+        """Freshly generated G-code for `path`, as byte chunks."""
+        return gcode_chunks(self.power(path), self.settings, os.path.basename(path))
+
+    def output_size(self, path):
+        """Size of the G-code for `path`, rendering it to a spool the first time."""
+        key = self.key(path)
+        with self.lock:
+            size = self._sizes.get(key)
+        if size is None:
+            def fill(dst):
+                written = 0
+                for chunk in self.render(path):
+                    dst.write(chunk)
+                    written += len(chunk)
+                return written
+            size = self.spools.write(key, fill)
+            with self.lock:
+                self._sizes[key] = size
+            rows, cols = self.power(path).shape
+            log.info(f"Raster of {os.path.basename(path)}: {cols}x{rows} px, {size} bytes of G-code")
+        return size
+
+    def open(self, path):
+        self.output_size(path)
+        # Evicted by newer spools: render it again, to the same bytes
+        return self.spools.open(self.key(path)) or ChunkReader(self.render(path))
+
+    def chunks(self, path):
+        """The G-code for `path` as byte chunks, read from its spool."""
+        f = self.open(path)
+        try:
+            yield from iter(lambda: f.read(READ_SIZE), b"")
+        finally:
+            f.close()
+
+
+_ENGRAVERS = {}
+_ENGRAVERS_LOCK = threading.Lock()
+
+
+def shared_engraver(settings):
+    """The RasterEngraver for these settings, shared so a job is rendered once."""
+    key = json.dumps({**RASTER_DEFAULTS, **settings}, sort_keys=True)
+    with _ENGRAVERS_LOCK:
+        engraver = _ENGRAVERS.get(key)
+        if engraver is None:
+            engraver = _ENGRAVERS[key] = RasterEngraver(settings)
+        return engraver
+
+
+def gcode_name(image_path):
+    return os.path.splitext(os.path.basename(image_path))[0] + ".gcode"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert an image to raster engraving G-code.")
+    parser.add_argument("image")
+    parser.add_argument("-o", "--output", help="G-code file (default: image name with .gcode)")
+    parser.add_argument("--width", type=float, default=RASTER_DEFAULTS["width"], help="mm")
+    parser.add_argument("--interval", type=float, default=RASTER_DEFAULTS["interval"], help="mm per pixel/row")
+    parser.add_argument("--mode", choices=MODES, default=RASTER_DEFAULTS["mode"])
+    parser.add_argument("--power", type=int, default=RASTER_DEFAULTS["power"], help="S for black")
+    parser.add_argument("--min-power", type=int, default=RASTER_DEFAULTS["min_power"])
+    parser.add_argument("--feed", type=float, default=RASTER_DEFAULTS["feed"], help="mm/min")
+    parser.add_argument("--origin", type=float, nargs=2, default=RASTER_DEFAULTS["origin"], metavar=("X", "Y"))
+    parser.add_argument("--one-way", action="store_true", help="burn every row left to right")
+    parser.add_argument("--negative", action="store_true")
+    args = parser.parse_args(argv)
+
+    engraver = RasterEngraver({
+        "width": args.width, "interval": args.interval, "mode": args.mode, "power": args.power,
+        "min_power": args.min_power, "feed": args.feed, "origin": list(args.origin),
+        "bidirectional": not args.one_way, "negative": args.negative,
+    })
+    output = args.output or gcode_name(args.image)
+    size = 0
+    with open(output, "wb") as f:
+        for chunk in engraver.render(args.image):
+            f.write(chunk)
+            size += len(chunk)
+    rows, cols = engraver.power(args.image).shape
+    print(f"{output}: {cols}x{rows} px, {size} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
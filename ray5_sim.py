@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Ray5's ESP3D web server, for tests and benchmarks.
+
+Emulates the endpoints Ray5Client uses:
+
+    GET  /files?path=/dir                     JSON listing of the in-memory SD card
+    POST /upload?path=/dir                    multipart upload, parsed as a stream
+    GET  /command?plain=[ESP420]|[ESP400]     firmware info / settings
+    GET  /command?commandText=$SD/Delete=...  delete a file
+
+Network conditions can be degraded with a fixed latency plus jitter, a bandwidth
+cap, a probability of dropping the connection without answering, and a
+probability of answering HTTP 500.
+
+    python ray5_sim.py --port 8848 --latency 0.05 --bandwidth 200000
+"""
+import argparse
+import hashlib
+import json
+import posixpath
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ESP420_TEMPLATE = (
+    "Chip ID: 10203040\n"
+    "CPU Frequency: 240Mhz\n"
+    "Free memory: 142.31 KB\n"
+    "SD card Size: {used} / {total}\n"
+    "Current WiFi Mode: STA ({mac})\n"
+    "Connected to: ShopWiFi\n"
+    "IP Mode: DHCP\n"
+    "IP: {ip}\n"
+    "FW version: {fw}\n"
+)
+
+
+class SimFile:
+    __slots__ = ("size", "sha256", "data", "mtime")
+
+    def __init__(self, size, sha256=None, data=None):
+        self.size = size
+        self.sha256 = sha256
+        self.data = data
+        self.mtime = time.time()
+
+
+class SimSDCard:
+    """Flat path -> SimFile map; directories are implied by paths or created explicitly."""
+
+    def __init__(self, capacity=4 * 1024 ** 3, keep_data=False):
+        self.capacity = capacity
+        self.keep_data = keep_data
+        self.files = {}
+        self.dirs = {"/"}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def norm(path):
+        path = posixpath.normpath("/" + (path or "/").lstrip("/"))
+        return "/" if path in ("/", "//") else path
+
+    def used(self):
+        return sum(f.size for f in self.files.values())
+
+    def _add_dirs(self, path):
+        while path not in self.dirs:
+            self.dirs.add(path)
+            path = posixpath.dirname(path)
+
+    def add(self, path, size, sha256=None, data=None):
+        path = self.norm(path)
+        with self.lock:
+            self.files[path] = SimFile(size, sha256, data if self.keep_data else None)
+            self._add_dirs(posixpath.dirname(path))
+
+    def mkdir(self, path):
+        with self.lock:
+            self._add_dirs(self.norm(path))
+
+    def delete(self, path):
+        path = self.norm(path)
+        with self.lock:
+            if path in self.files:
+                del self.files[path]
+                return True
+            if path in self.dirs and path != "/":
+                prefix = path + "/"
+                if any(p.startswith(prefix) for p in self.files) or any(d.startswith(prefix) for d in self.dirs):
+                    return False
+                self.dirs.discard(path)
+                return True
+            return False
+
+    def listing(self, path):
+        path = self.norm(path)
+        with self.lock:
+            if path not in self.dirs:
+                return None
+            entries = []
+            for d in sorted(self.dirs):
+                if d != path and posixpath.dirname(d) == path:
+                    entries.append({"name": posixpath.basename(d), "size": "-1"})
+            for p in sorted(self.files):
+                if posixpath.dirname(p) == path:
+                    entries.append({"name": posixpath.basename(p), "size": str(self.files[p].size)})
+            return entries
+
+    def populate(self, count, size=1024, path="/", prefix="job"):
+        for i in range(count):
+            self.add(posixpath.join(self.norm(path), f"{prefix}_{i:05d}.gcode"), size)
+
+
+class SimRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server_version = "ESP3D-Sim/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.sim.verbose:
+            super().log_message(format, *args)
+
+    # --- fault injection -------------------------------------------------
+
+    def inject_faults(self):
+        """Apply latency and maybe drop / fail the request. Returns False if handled."""
+        sim = self.server.sim
+        sim.count("requests")
+        delay = sim.latency + (random.uniform(0, sim.jitter) if sim.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        if sim.drop_rate and random.random() < sim.drop_rate:
+            sim.count("dropped")
+            self.close_connection = True
+            # shutdown rather than close: rfile/wfile still hold references to the socket
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return False
+        if sim.error_rate and random.random() < sim.error_rate:
+            sim.count("errors")
+            self.discard_body()
+            self.reply(500, "error: injected failure\n")
+            return False
+        return True
+
+    def throttle(self, nbytes, started, sent):
+        bandwidth = self.server.sim.bandwidth
+        if bandwidth:
+            ahead = (sent + nbytes) / bandwidth - (time.perf_counter() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    def discard_body(self):
+        remaining = int(self.headers.get("Content-Length") or 0)
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 65536))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+
+    def reply(self, code, body, content_type="text/plain"):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        started = time.perf_counter()
+        sent = 0
+        for i in range(0, len(data), 8192):
+            chunk = data[i:i + 8192]
+            self.throttle(len(chunk), started, sent)
+            self.wfile.write(chunk)
+            sent += len(chunk)
+
+    # --- endpoints -------------------------------------------------------
+
+    def do_GET(self):
+        if not self.inject_faults():
+            return
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+        if url.path == "/files":
+            self.handle_files(query.get("path", ["/"])[0])
+        elif url.path == "/command":
+            if "plain" in query:
+                self.handle_plain(query["plain"][0])
+            elif "commandText" in query:
+                self.handle_command_text(query["commandText"][0])
+            else:
+                self.reply(400, "error: missing command\n")
+        else:
+            self.reply(404, "error: not found\n")
+
+    def do_POST(self):
+        if not self.inject_faults():
+            return
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/upload":
+            self.discard_body()
+            self.reply(404, "error: not found\n")
+            return
+        query = urllib.parse.parse_qs(url.query)
+        self.handle_upload(query.get("path", ["/"])[0])
+
+    def handle_files(self, path):
+        sim = self.server.sim
+        entries = sim.sd.listing(path)
+        if entries is None:
+            self.reply(200, json.dumps({"files": [], "path": path, "status": "Not found"}), "application/json")
+            return
+        used = sim.sd.used()
+        body = {
+            "files": entries,
+            "path": sim.sd.norm(path),
+            "total": str(sim.sd.capacity),
+            "used": str(used),
+            "occupation": str(int(100 * used / sim.sd.capacity)),
+            "status": "Ok",
+        }
+        self.reply(200, json.dumps(body), "application/json")
+
+    def handle_plain(self, cmd):
+        sim = self.server.sim
+        cmd = cmd.strip()
+        if cmd == "[ESP420]":
+            self.reply(200, ESP420_TEMPLATE.format(
+                mac=sim.mac, ip=self.server.server_address[0], fw=sim.firmware,
+                used=sim.sd.used(), total=sim.sd.capacity))
+        elif cmd == "[ESP400]":
+            self.reply(200, json.dumps({"EEPROM": [{"F": "network", "P": "0", "T": "S", "V": "ray5", "H": "hostname"}]}),
+                       "application/json")
+        else:
+            self.reply(200, "ok\n")
+
+    def handle_command_text(self, text):
+        prefix = "$SD/Delete="
+        if not text.startswith(prefix):
+            self.reply(200, "ok\n")
+            return
+        if self.server.sim.sd.delete(text[len(prefix):]):
+            self.server.sim.count("deleted")
+            self.reply(200, "ok\n")
+        else:
+            self.reply(404, "error: file not found\n")
+
+    def handle_upload(self, path):
+        sim = self.server.sim
+        ctype = self.headers.get("Content-Type", "")
+        length = int(self.headers.get("Content-Length") or 0)
+        if "boundary=" not in ctype or not length:
+            self.discard_body()
+            self.reply(400, "error: expected multipart body with Content-Length\n")
+            return
+        boundary = ctype.split("boundary=", 1)[1].strip().strip('"').encode("ascii")
+        parser = MultipartStreamParser(boundary, keep_data=sim.sd.keep_data)
+        started = time.perf_counter()
+        received = 0
+        while received < length:
+            want = min(65536, length - received)
+            self.throttle(want, started, received)
+            chunk = self.rfile.read(want)
+            if not chunk:
+                break
+            received += len(chunk)
+            parser.feed(chunk)
+        sim.count("bytes_uploaded", received)
+        if received < length or not parser.filename:
+            self.reply(400, "error: incomplete upload\n")
+            return
+        declared = parser.fields.get("size")
+        if declared is not None and declared.isdigit() and int(declared) != parser.file_size:
+            self.reply(500, "error: size mismatch\n")
+            return
+        target = posixpath.join(sim.sd.norm(parser.fields.get("path") or path), parser.filename)
+        data = bytes(parser.data) if parser.data is not None else None
+        sim.sd.add(target, parser.file_size, parser.sha256.hexdigest(), data)
+        sim.count("uploads")
+        self.reply(200, json.dumps({"status": "Ok", "path": target}), "application/json")
+
+
+class MultipartStreamParser:
+    """Incremental multipart/form-data parser that never buffers the file part."""
+
+    def __init__(self, boundary, keep_data=False):
+        self.delimiter = b"\r\n--" + boundary
+        self.buffer = b"\r\n"
+        self.fields = {}
+        self.filename = None
+        self.file_size = 0
+        self.sha256 = hashlib.sha256()
+        self.keep_data = keep_data
+        self.data = bytearray() if keep_data else None
+        self.state = "boundary"
+        self.part_name = None
+        self.part_value = None
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        while True:
+            if self.state == "boundary":
+                idx = self.buffer.find(self.delimiter)
+                if idx < 0 or len(self.buffer) < idx + len(self.delimiter) + 2:
+                    return
+                rest = self.buffer[idx + len(self.delimiter):]
+                if rest.startswith(b"--"):
+                    self.state = "done"
+                    return
+                self.buffer = rest[2:]
+                self.state = "headers"
+            elif self.state == "headers":
+                idx = self.buffer.find(b"\r\n\r\n")
+                if idx < 0:
+                    return
+                headers = self.buffer[:idx].decode("utf-8", errors="ignore")
+                self.buffer = self.buffer[idx + 4:]
+                self.part_name, filename = None, None
+                for line in headers.split("\r\n"):
+                    if line.lower().startswith("content-disposition:"):
+                        name = re.search(r'\bname="([^"]*)"', line)
+                        self.part_name = name.group(1) if name else None
+                        fname = re.search(r'\bfilename="([^"]*)"', line)
+                        # Ray5Client escapes quotes in file names as %22
+                        filename = fname.group(1).replace("%22", '"') if fname else None
+                if filename is not None:
+                    self.filename = posixpath.basename(filename)
+                    self.part_value = None
+                else:
+                    self.part_value = bytearray()
+                self.state = "body"
+            elif self.state == "body":
+                idx = self.buffer.find(self.delimiter)
+                if idx < 0:
+                    # Keep a tail that might hold the start of the delimiter
+                    keep = len(self.delimiter) - 1
+                    if len(self.buffer) > keep:
+                        self.consume(self.buffer[:-keep])
+                        self.buffer = self.buffer[-keep:]
+                    return
+                self.consume(self.buffer[:idx])
+                if self.part_value is not None and self.part_name:
+                    self.fields[self.part_name] = self.part_value.decode("utf-8", errors="ignore")
+                self.buffer = self.buffer[idx:]
+                self.state = "boundary"
+            else:
+                return
+
+    def consume(self, data):
+        if self.part_value is not None:
+            self.part_value += data
+            return
+        self.file_size += len(data)
+        self.sha256.update(data)
+        if self.keep_data:
+            self.data += data
+
+
+class SimHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response (cancelled or timed-out requests) are expected
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class Ray5Simulator:
+    """Threaded fake laser; use as a context manager or call start()/stop()."""
+
+    def __init__(self, host="127.0.0.1", port=0, mac="24:0A:C4:00:00:01", firmware="3.0.0-sim",
+                 latency=0.0, jitter=0.0, bandwidth=None, drop_rate=0.0, error_rate=0.0,
+                 keep_data=False, verbose=False):
+        self.sd = SimSDCard(keep_data=keep_data)
+        self.mac = mac
+        self.firmware = firmware
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.drop_rate = drop_rate
+        self.error_rate = error_rate
+        self.verbose = verbose
+        self.stats = {"requests": 0, "dropped": 0, "errors": 0, "uploads": 0, "deleted": 0, "bytes_uploaded": 0}
+        self.server = SimHTTPServer((host, port), SimRequestHandler)
+        self.server.sim = self
+        self.stats_lock = threading.Lock()
+        self.thread = None
+
+    def count(self, key, amount=1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    @property
+    def host(self):
+        return self.server.server_address[0]
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated Ray5 / ESP3D web server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8848)
+    parser.add_argument("--mac", default="24:0A:C4:00:00:01")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, seconds")
+    parser.add_argument("--bandwidth", type=float, default=None, help="bytes per second cap")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="probability of closing without a response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of an HTTP 500")
+    parser.add_argument("--files", type=int, default=0, help="pre-populate the SD card with N files")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    sim = Ray5Simulator(args.host, args.port, args.mac, latency=args.latency, jitter=args.jitter,
+                        bandwidth=args.bandwidth, drop_rate=args.drop_rate, error_rate=args.error_rate,
+                        verbose=args.verbose)
+    sim.sd.populate(args.files)
+    print(f"Simulated Ray5 listening on http://{sim.host}:{sim.port} (MAC {sim.mac})")
+    try:
+        sim.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
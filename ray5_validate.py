@@ -0,0 +1,253 @@
+"""Safety checks for G-code before it is uploaded: one pass over the file, pluggable rules.
+
+The file is decoded block by block with the NumPy tokenizer from ray5_analyze,
+so a rule sees whole arrays with one entry per line and costs a few vector
+operations per block rather than Python work per line. Built-in rules:
+
+    work_area   a move ends outside 0..width, 0..height ("machine": {"work_area": [400, 400]})
+    max_power   an S word above "machine": {"max_power": 1000}
+    feed_set    a G1/G2/G3 move before any F word (Grbl error 22)
+    laser_off   the laser is still on at the end: M3/M4 without a later M5 (or M2/M30)
+
+Positions follow G90/G91 and G20/G21. Work offsets (G92, G54..) are not applied
+and arcs are checked at their end points only. Choose rules with
+"validate": {"rules": [...]} in config.json, or turn the check off with
+"validate": {"enabled": false}.
+
+    python ray5_validate.py job.gcode
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+
+from ray5_analyze import GcodeDecoder, file_chunks, iter_blocks
+from ray5_gcode import machine_from_config
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+log = logging.getLogger("ray5.validate")
+
+# Slack for coordinates written at the very edge of the work area
+EDGE = 1e-6
+
+
+@dataclass(slots=True)
+class Violation:
+    line: int
+    rule: str
+    message: str
+
+    def __str__(self):
+        return f"line {self.line}: {self.message}"
+
+
+@dataclass(slots=True)
+class ValidationReport:
+    path: str = ""
+    lines: int = 0
+    violations: list = field(default_factory=list)  # the first few of each rule, in line order
+    counts: dict = field(default_factory=dict)      # rule -> number of offending lines
+    elapsed: float = 0.0
+
+    @property
+    def ok(self):
+        return not self.counts
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def summary(self, limit=5):
+        """Name, counts and the first `limit` violations, one per line."""
+        name = os.path.basename(self.path) or "G-code"
+        if self.ok:
+            return f"{name}: {self.lines} lines OK"
+        rules = ", ".join(f"{rule} x{n}" for rule, n in self.counts.items())
+        shown = sorted(self.violations, key=lambda v: v.line)[:limit]
+        text = "\n".join([f"{name}: {self.total} problem(s) ({rules})", *(f"  {v}" for v in shown)])
+        if self.total > len(shown):
+            text += f"\n  ... and {self.total - len(shown)} more"
+        return text
+
+    def __str__(self):
+        return self.summary()
+
+
+class Rule:
+    """One check. `check` returns the offending line indices of a Block and
+    `message` describes one of them; `finish` returns [(line, message)] for
+    what is only known once the whole file has been read."""
+
+    name = None
+
+    def __init__(self, machine):
+        self.machine = machine
+
+    def check(self, block):
+        return ()
+
+    def message(self, block, i):
+        return self.name
+
+    def finish(self):
+        return []
+
+
+class WorkAreaRule(Rule):
+    name = "work_area"
+
+    def check(self, block):
+        width, height = self.machine["work_area"]
+        x, y = block.end["X"], block.end["Y"]
+        outside = (x < -EDGE) | (x > width + EDGE) | (y < -EDGE) | (y > height + EDGE)
+        return np.flatnonzero(outside & block.given & ~np.isnan(block.motion))
+
+    def message(self, block, i):
+        width, height = self.machine["work_area"]
+        return (f"move to X{block.end['X'][i]:.3f} Y{block.end['Y'][i]:.3f} "
+                f"is outside the {width:g} x {height:g} mm work area")
+
+
+class PowerRule(Rule):
+    name = "max_power"
+
+    def check(self, block):
+        self.words = block.column("S")
+        return np.flatnonzero(self.words > self.machine["max_power"])
+
+    def message(self, block, i):
+        return f"S{self.words[i]:g} is above the power limit S{self.machine['max_power']:g}"
+
+
+class FeedRule(Rule):
+    name = "feed_set"
+
+    def check(self, block):
+        return np.flatnonzero(block.given & (block.motion >= 1) & np.isnan(block.feed))
+
+    def message(self, block, i):
+        return f"G{block.motion[i]:.0f} move before any feed rate (F) is set"
+
+
+class LaserOffRule(Rule):
+    name = "laser_off"
+
+    def __init__(self, machine):
+        super().__init__(machine)
+        self.on = False
+        self.on_line = None
+
+    def check(self, block):
+        codes = block.modal("M", {3: 1, 4: 1})
+        turned_on = np.flatnonzero(codes == 1)
+        if len(turned_on):
+            self.on_line = block.first_line + int(turned_on[-1])
+        self.on = bool(block.laser[-1] == 1)
+        return ()
+
+    def finish(self):
+        if self.on:
+            return [(self.on_line, "laser is still on at the end of the file (no M5 after this M3/M4)")]
+        return []
+
+
+RULES = {rule.name: rule for rule in (WorkAreaRule, PowerRule, FeedRule, LaserOffRule)}
+
+
+class Validator:
+    """Runs rules over G-code blocks fed in order; keeps up to `limit` messages per rule."""
+
+    def __init__(self, machine=None, rules=None, limit=10):
+        self.machine = machine or machine_from_config({})
+        self.rules = [RULES[name](self.machine) for name in (rules or RULES)]
+        self.limit = limit
+        self.decoder = GcodeDecoder()
+        self.report = ValidationReport()
+
+    def add(self, rule, found, total):
+        kept = sum(1 for v in self.report.violations if v.rule == rule.name)
+        self.report.violations += [Violation(line, rule.name, message)
+                                   for line, message in found[:max(0, self.limit - kept)]]
+        self.report.counts[rule.name] = self.report.counts.get(rule.name, 0) + total
+
+    def feed(self, data):
+        block = self.decoder.decode(data)
+        self.report.lines = self.decoder.lines
+        if block is None:
+            return
+        for rule in self.rules:
+            hits = rule.check(block)
+            if len(hits):
+                # Messages only for the lines that will be shown
+                found = [(block.first_line + int(i), rule.message(block, int(i))) for i in hits[:self.limit]]
+                self.add(rule, found, len(hits))
+
+    def finish(self):
+        for rule in self.rules:
+            found = rule.finish()
+            if found:
+                self.add(rule, found, len(found))
+        return self.report
+
+
+def validate_chunks(chunks, machine=None, rules=None, path=""):
+    """ValidationReport for G-code given as an iterable of byte chunks."""
+    start = time.perf_counter()
+    validator = Validator(machine, rules)
+    for block in iter_blocks(chunks):
+        validator.feed(block)
+    report = validator.finish()
+    report.path = path
+    report.elapsed = time.perf_counter() - start
+    if not report.ok:
+        log.warning(report.summary(3))
+    return report
+
+
+def validate_file(path, machine=None, rules=None):
+    return validate_chunks(file_chunks(path), machine, rules, path)
+
+
+def validation_from_config(config):
+    """(machine, rules) to validate with, or None when checking is off or numpy is missing."""
+    settings = config.get("validate") or {}
+    if not settings.get("enabled", True):
+        return None
+    if not HAS_NUMPY:
+        log.warning("G-code is not checked before upload: numpy is not installed")
+        return None
+    return machine_from_config(config), settings.get("rules")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check G-code files against the machine limits.")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--work-area", type=float, nargs=2, metavar=("X", "Y"))
+    parser.add_argument("--max-power", type=float)
+    parser.add_argument("--rules", nargs="+", choices=list(RULES))
+    parser.add_argument("-n", "--show", type=int, default=10, help="violations to list per file")
+    args = parser.parse_args(argv)
+    if not HAS_NUMPY:
+        sys.exit("ray5_validate: numpy is not installed (pip install numpy)")
+    machine = machine_from_config({})
+    if args.work_area:
+        machine["work_area"] = args.work_area
+    if args.max_power is not None:
+        machine["max_power"] = args.max_power
+    failed = 0
+    for path in args.files:
+        report = validate_file(path, machine, args.rules)
+        print(f"{report.summary(args.show)} ({report.elapsed:.2f}s)")
+        failed += not report.ok
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""Watch a CAM output folder and hand finished G-code files to the upload queue.
+
+FolderSync follows one directory (not recursive) with inotify on Linux, or by
+polling its listing elsewhere or when inotify is unavailable. Network shares
+(SMB/NFS) don't report writes made by other machines through inotify, so
+polling can be forced with use_inotify=False.
+
+A file counts as finished once its size and mtime have not changed for
+`settle` seconds. Files that settle close together are reported as one batch.
+SyncEventLog appends one JSON line per step (seen, queued, on_sd, removed,
+failed) so the time from a file appearing on disk to it being on the SD card
+can be read back later.
+"""
+import ctypes
+import ctypes.util
+import fnmatch
+import json
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+log = logging.getLogger("ray5.sync")
+
+DEFAULT_PATTERNS = ("*.gcode", "*.gc", "*.nc", "*.ngc", "*.g")
+# Editors and CAM tools write to these first, then rename
+IGNORED_PATTERNS = (".*", "~*", "*.tmp", "*.part", "*.crdownload", "*~")
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    _libc.inotify_init1.argtypes = [ctypes.c_int]
+    _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    HAS_INOTIFY = sys.platform.startswith("linux")
+except (OSError, AttributeError):
+    HAS_INOTIFY = False
+
+
+class InotifyWatcher:
+    """Change events for the files in one directory, straight from the kernel."""
+
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+    def __init__(self, folder):
+        if not HAS_INOTIFY:
+            raise OSError("inotify is not available on this platform")
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if _libc.inotify_add_watch(self.fd, os.fsencode(folder), self.MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {folder}")
+
+    def wait(self, timeout):
+        """Returns [(kind, name)] with kind "changed", "removed" or "rescan"."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & (IN_Q_OVERFLOW | IN_DELETE_SELF):
+                events.append(("rescan", None))
+            elif mask & IN_ISDIR or not name:
+                continue
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                events.append(("removed", name))
+            else:
+                events.append(("changed", name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Same events as InotifyWatcher, found by comparing directory snapshots."""
+
+    def __init__(self, folder, interval=1.0):
+        self.folder = folder
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        entries = {}
+        try:
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file():
+                            st = entry.stat()
+                            entries[entry.name] = (st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError as e:
+            log.warning(f"Cannot list {self.folder}: {e}")
+        return entries
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        current = self.scan()
+        events = [("changed", name) for name, sig in current.items() if self.snapshot.get(name) != sig]
+        events += [("removed", name) for name in self.snapshot.keys() - current.keys()]
+        self.snapshot = current
+        return events
+
+    def close(self):
+        pass
+
+
+class FolderSync(threading.Thread):
+    """Reports finished files in `folder` to on_ready([(path, first_seen)]) in batches.
+
+    Files already in the folder at start are reported too (callers skip unchanged
+    ones with the upload manifest). If `on_removed` is given it receives the paths
+    of previously reported files that were deleted or moved away.
+    """
+
+    def __init__(self, folder, on_ready, on_removed=None, patterns=DEFAULT_PATTERNS, settle=2.0,
+                 poll_interval=1.0, use_inotify=True):
+        super().__init__(daemon=True)
+        self.folder = os.path.abspath(folder)
+        self.on_ready = on_ready
+        self.on_removed = on_removed
+        self.patterns = patterns
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        # name -> [first_seen, (size, mtime_ns), unchanged_since]
+        self.pending = {}
+        self.reported = set()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def wanted(self, name):
+        if any(fnmatch.fnmatch(name, p) for p in IGNORED_PATTERNS):
+            return False
+        return any(fnmatch.fnmatch(name.lower(), p) for p in self.patterns)
+
+    def make_watcher(self):
+        if self.use_inotify and HAS_INOTIFY:
+            try:
+                return InotifyWatcher(self.folder)
+            except OSError as e:
+                log.warning(f"inotify unavailable for {self.folder} ({e}); polling instead")
+        return PollingWatcher(self.folder, self.poll_interval)
+
+    def signature(self, name):
+        try:
+            st = os.stat(os.path.join(self.folder, name))
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def touch(self, name, now):
+        sig = self.signature(name)
+        if sig is None:
+            return
+        entry = self.pending.get(name)
+        if entry is None:
+            self.pending[name] = [now, sig, now]
+            log.debug(f"Seen {name}")
+        elif entry[1] != sig:
+            entry[1] = sig
+            entry[2] = now
+
+    def rescan(self, now):
+        try:
+            names = [e.name for e in os.scandir(self.folder) if e.is_file()]
+        except OSError as e:
+            log.warning(f"Cannot list {self.folder}: {e}")
+            return
+        for name in names:
+            if self.wanted(name):
+                self.touch(name, now)
+
+    def run(self):
+        watcher = self.make_watcher()
+        log.info(f"Watching {self.folder} with {type(watcher).__name__}")
+        self.rescan(time.time())
+        try:
+            while not self._stop_event.is_set():
+                removed = []
+                for kind, name in watcher.wait(min(0.5, self.settle / 2)):
+                    now = time.time()
+                    if kind == "rescan":
+                        self.rescan(now)
+                    elif not self.wanted(name):
+                        continue
+                    elif kind == "removed":
+                        self.pending.pop(name, None)
+                        if name in self.reported:
+                            self.reported.discard(name)
+                            removed.append(os.path.join(self.folder, name))
+                    else:
+                        self.touch(name, now)
+                if removed and self.on_removed:
+                    self.on_removed(removed)
+                self.flush(time.time())
+        finally:
+            watcher.close()
+
+    def flush(self, now):
+        # The polling watcher never re-reports a file that stopped changing, so re-stat here
+        for name, entry in list(self.pending.items()):
+            sig = self.signature(name)
+            if sig is None:
+                del self.pending[name]
+            elif sig != entry[1]:
+                entry[1] = sig
+                entry[2] = now
+        settled = [name for name, entry in self.pending.items() if now - entry[2] >= self.settle]
+        if not settled:
+            return
+        # Coalesce bursts: hold finished files while others are still being written,
+        # unless the oldest one has already waited a full extra settle period
+        waiting = len(settled) < len(self.pending)
+        if waiting and max(now - self.pending[n][2] for n in settled) < 2 * self.settle:
+            return
+        batch = [(os.path.join(self.folder, name), self.pending.pop(name)[0]) for name in sorted(settled)]
+        self.reported.update(name for name in settled)
+        log.info(f"{len(batch)} file(s) ready in {self.folder}")
+        self.on_ready(batch)
+
+
+class SyncEventLog:
+    """Append-only JSON lines log of sync steps, with seen-to-SD latency per file."""
+
+    def __init__(self, path="sync_events.jsonl"):
+        self.path = path
+        self.first_seen = {}
+        self.lock = threading.Lock()
+
+    def write(self, event, path, **fields):
+        record = {"time": time.time(), "event": event, "file": path, **fields}
+        with self.lock:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                log.error(f"Failed to write sync event log: {e}")
+        return record
+
+    def seen(self, path, when):
+        with self.lock:
+            self.first_seen[os.path.abspath(path)] = when
+        return self.write("seen", path, seen=when)
+
+    def tracked(self, path):
+        with self.lock:
+            return os.path.abspath(path) in self.first_seen
+
+    def finished(self, path, event="on_sd", **fields):
+        """Close out a file seen earlier; adds the latency since it appeared. None if untracked."""
+        with self.lock:
+            seen = self.first_seen.pop(os.path.abspath(path), None)
+        if seen is None:
+            return None
+        latency = time.time() - seen
+        if event == "on_sd":
+            log.info(f"{os.path.basename(path)} on SD {latency:.1f}s after it appeared")
+        return self.write(event, path, seen=seen, latency=round(latency, 3), **fields)
@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from ray5_analyze import analyze_chunks, tokenize
+from ray5_validate import validate_chunks
+
+
+def test_tokenize_plain_words():
+    letters, values, lines, count = tokenize(b"G1 X5.5 Y-2\n")
+    assert bytes(letters) == b"GXY"
+    assert list(values) == [1.0, 5.5, -2.0]
+    assert list(lines) == [0, 0, 0]
+
+
+def test_checksum_is_not_part_of_the_last_word():
+    letters, values, _, _ = tokenize(b"N10 G1 X5*67\n")
+    assert bytes(letters) == b"NGX"
+    assert list(values) == [10.0, 1.0, 5.0]
+
+
+def test_checksummed_lines_analyse_like_plain_ones():
+    plain = analyze_chunks([b"G1 X5 F600\nG1 Y3\n"])
+    checked = analyze_chunks([b"N10 G1 X5 F600*35\nN11 G1 Y3*97\n"])
+    assert checked.bounds == plain.bounds == (0.0, 0.0, 5.0, 3.0)
+    assert checked.burn + checked.travel == pytest.approx(8.0)
+
+
+def test_checksum_does_not_trip_the_work_area_rule():
+    report = validate_chunks([b"N10 G0 X5*67\nN11 M5*12\n"])
+    assert report.ok, report.summary()
@@ -0,0 +1,45 @@
+from ray5_client import OpResult, UploadQueue
+
+
+def make_queue(tmp_path, device):
+    return UploadQueue(lambda: None, lambda: True, path=str(tmp_path / "upload_queue.json"),
+                       get_device=lambda: device)
+
+
+def test_jobs_for_another_laser_stay_queued(tmp_path):
+    local = tmp_path / "job.gcode"
+    local.write_bytes(b"G0 X1\n")
+    queue = make_queue(tmp_path, "laser-a")
+    queue.add([str(local)], "/", "laser-b")
+    assert queue._next_job() == (None, None)
+
+    queue = make_queue(tmp_path, "laser-b")  # restarted while laser B is connected
+    job, _ = queue._next_job()
+    assert job.device == "laser-b"
+
+
+def test_success_clears_the_failure_of_an_earlier_attempt(tmp_path):
+    local = tmp_path / "job.gcode"
+    local.write_bytes(b"G0 X1\n")
+    answers = iter([None, [{"name": "job.gcode", "size": "6"}]])
+
+    class Client:
+        last_listing_error = OpResult("files", False, None, 0.0, 0, "timeout", "timed out")
+
+        def upload_size(self, path, transform=None):
+            return 6
+
+        def upload_file(self, *args, **kwargs):
+            return OpResult("upload", True, 200, 0.0, 6)
+
+        def list_files(self, path):
+            return next(answers)
+
+    events = []
+    queue = UploadQueue(Client, lambda: True, path=str(tmp_path / "upload_queue.json"),
+                        notify=lambda event, job: events.append((event, job.category, job.last_error)))
+    job, = queue.add([str(local)])
+    queue._attempt(job)
+    assert events[-1][:2] == ("retry", "timeout")
+    queue._attempt(job)
+    assert events[-1] == ("done", None, None)
@@ -0,0 +1,19 @@
+from ray5_discovery import find_laser
+from ray5_sim import Ray5Simulator
+
+TARGET_MAC = "24:0A:C4:00:00:2A"
+
+
+def test_sweep_finds_the_laser_among_decoys():
+    # Every 127.x address is loopback on Linux: one simulator per alias, same port
+    target = Ray5Simulator("127.0.0.200", 0, TARGET_MAC).start()
+    servers = [target] + [Ray5Simulator(f"127.0.0.{10 + i}", target.port, f"24:0A:C4:00:01:{i:02X}").start()
+                          for i in range(5)]
+    try:
+        found = find_laser(TARGET_MAC, cidr="127.0.0.0/24", port=target.port, timeout=1.0)
+    finally:
+        for server in servers:
+            server.stop()
+    assert found is not None
+    assert found[0] == "127.0.0.200"
+    assert "FW version" in found[1]
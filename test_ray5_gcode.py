@@ -0,0 +1,53 @@
+from ray5_gcode import Minifier, minify_file, verify
+
+
+def minify(text, precision=None):
+    return b"".join(Minifier(precision).lines(text.encode().splitlines(keepends=True))).decode()
+
+
+def write(path, text):
+    path.write_text(text, newline="")
+    return str(path)
+
+
+def test_repeated_modal_words_are_dropped():
+    assert minify("G90\nG1 X10.500 Y0.000 F3000 S0\nG1 X12.000 Y0.000 F3000 S250\n") == \
+        "G90\nG1X10.5Y0F3000S0\nX12S250\n"
+
+
+def test_state_set_on_a_checksummed_line_is_not_assumed(tmp_path):
+    text = "G90\nG1 X10 F600 S500\nN5 G0 X20 S0*71\nG1 X30 S500\n"
+    assert minify(text).splitlines()[-1] == "G1X30S500"
+
+    original = write(tmp_path / "job.gcode", text)
+    output = tmp_path / "job.min.gcode"
+    with open(output, "wb") as dst:
+        minify_file(original, dst)
+    assert verify(original, str(output))[0]
+
+
+def test_verify_catches_modal_state_lost_after_a_checksummed_line(tmp_path):
+    original = write(tmp_path / "job.gcode", "G90\nG1 X10 F600 S500\nN5 G0 X20 S0*71\nG1 X30 S500\n")
+    broken = write(tmp_path / "job.min.gcode", "G90\nG1X10F600S500\nN5 G0 X20 S0*71\nX30\n")
+    assert not verify(original, broken)[0]
+
+
+def test_increments_are_not_rounded(tmp_path):
+    text = "G91 G1 X0.04 F600\n" * 100
+    assert minify(text, precision=1).splitlines()[:2] == ["G91G1X0.04F600", "G91X0.04"]
+
+    original = write(tmp_path / "job.gcode", text)
+    output = tmp_path / "job.min.gcode"
+    with open(output, "wb") as dst:
+        minify_file(original, dst, precision=1)
+    assert verify(original, str(output), 0.05 + 1e-9)[0]
+
+
+def test_verify_adds_up_increments(tmp_path):
+    original = write(tmp_path / "job.gcode", "G91 G1 X0.04 F600\n" * 100)
+    drifted = write(tmp_path / "job.min.gcode", "G91 G1 X0 F600\n" * 100)
+    assert not verify(original, drifted, 0.05 + 1e-9)[0]
+
+
+def test_absolute_coordinates_are_rounded():
+    assert minify("G90 G1 X10.04 Y3.96 F600\n", precision=1) == "G90G1X10Y4F600\n"